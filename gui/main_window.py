@@ -22,6 +22,7 @@ class MainWindow(QtWidgets.QMainWindow):
     playbackErrorSignal = QtCore.Signal() 
     failSafeSignal = QtCore.Signal()
     logSignal = QtCore.Signal(str)
+    progressSignal = QtCore.Signal(int, int, str)
     
     def __init__(self, recorder, player, settings):
         super().__init__()
@@ -65,10 +66,43 @@ class MainWindow(QtWidgets.QMainWindow):
         self.playbackErrorSignal.connect(self.playback_error)
         self.failSafeSignal.connect(self.handle_failsafe)
         self.logSignal.connect(self.add_log)
+        self.progressSignal.connect(self.show_progress)
+        
+        # Playback runs in a separate process; its reports arrive on a reader thread
+        self.player.set_log_callback(lambda message, level: self.logSignal.emit(message))
+        self.player.set_progress_callback(self.progressSignal.emit)
+        self.player.set_finished_callback(self.on_playback_ended)
         
         # Then setup UI and load shortcuts
         self.setup_ui()
         self.load_shortcuts()
+        self.offer_session_recovery()
+
+    def offer_session_recovery(self):
+        """Offer to restore a recording left behind by an unclean exit"""
+        if not self.recorder.has_recoverable_session():
+            return
+        reply = QtWidgets.QMessageBox.question(
+            self,
+            "Recover Recording",
+            "The previous recording session did not exit cleanly.\n\n"
+            "Do you want to recover the recorded actions?",
+            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
+            QtWidgets.QMessageBox.Yes
+        )
+        if reply != QtWidgets.QMessageBox.Yes:
+            self.recorder.discard_recovered_session()
+            return
+        try:
+            recovered_code = self.recorder.recover_session()
+            if recovered_code:
+                self.code_text.setPlainText(recovered_code)
+                self.update_gallery()
+            self.add_log("Recovered recording from journal.")
+        except Exception as e:
+            self.logger.error(f"Failed to recover recording: {e}")
+            self.recorder.discard_recovered_session()
+            QtWidgets.QMessageBox.critical(self, "Error", f"Failed to recover recording:\n{str(e)}")
 
     def setup_ui(self):
         central_widget = QtWidgets.QWidget()
@@ -118,6 +152,12 @@ class MainWindow(QtWidgets.QMainWindow):
         
         left_layout.addWidget(button_frame)
         
+        # Playback progress, shown while a macro runs
+        self.playback_progress = QtWidgets.QProgressBar()
+        self.playback_progress.setFixedHeight(16)
+        self.playback_progress.hide()
+        left_layout.addWidget(self.playback_progress)
+        
         # Code editor container for better alignment
         code_container = QtWidgets.QFrame()
         code_container.setFrameStyle(QtWidgets.QFrame.NoFrame)
@@ -325,40 +365,55 @@ class MainWindow(QtWidgets.QMainWindow):
             QtWidgets.QMessageBox.critical(self, "Error", f"Failed to create screenshot:\n{str(e)}")
     
     def start_playback(self):
-        if not self.is_playing and self.code_text.toPlainText().strip():
+        """Starts the macro in a playback process, or stops the one running"""
+        if self.is_playing:
+            self.add_log("Stopping playback...")
+            self.player.stop()
+            return
+        code = self.code_text.toPlainText()
+        if self.recording_active or not code.strip():
+            return
+        try:
             self.is_playing = True
+            self.playback_progress.setValue(0)
+            self.playback_progress.show()
             self.update_button_states()
-            
-            try:
-                code = self.code_text.toPlainText()
-                if not code.strip():
-                    return
-                
-                try:
-                    self.player.play(code)
-                    self.playbackFinishedSignal.emit()
-                    self.logSignal.emit(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - INFO - Macro playback finished")
-                except pyautogui.FailSafeException:
-                    self.failSafeSignal.emit()
-                except Exception as e:
-                    print(f"Error during playback: {str(e)}")
-                    self.playbackErrorSignal.emit()
-                
-            except Exception as e:
-                print(f"Error starting playback: {str(e)}")
-                self.is_playing = False
-                self.update_button_states()
+            self.player.start(code)
+        except Exception as e:
+            print(f"Error starting playback: {str(e)}")
+            self.is_playing = False
+            self.playback_progress.hide()
+            self.update_button_states()
+
+    def on_playback_ended(self, status):
+        """Called from the player's reader thread when the playback process ends"""
+        if status == 'failsafe':
+            self.failSafeSignal.emit()
+        elif status == 'error':
+            self.playbackErrorSignal.emit()
+        else:
+            self.playbackFinishedSignal.emit()
+            self.logSignal.emit(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - INFO - Macro playback {status}")
+
+    @QtCore.Slot(int, int, str)
+    def show_progress(self, index, total, op):
+        """Playback progress handler"""
+        self.playback_progress.setMaximum(total)
+        self.playback_progress.setValue(index + 1)
+        self.playback_progress.setFormat(f"%v / %m  {op}")
     
     @QtCore.Slot()
     def playback_finished(self):
         """Playback finished handler"""
         self.is_playing = False
+        self.playback_progress.hide()
         self.update_button_states()
     
     @QtCore.Slot()
     def playback_error(self):
         """Playback error handler"""
         self.is_playing = False
+        self.playback_progress.hide()
         self.update_button_states()
         QtWidgets.QMessageBox.critical(self, "Error", "An error occurred while playing the macro")
     
@@ -366,6 +421,7 @@ class MainWindow(QtWidgets.QMainWindow):
     def handle_failsafe(self):
         """PyAutoGUI failsafe handler"""
         self.is_playing = False
+        self.playback_progress.hide()
         self.update_button_states()
         QtWidgets.QMessageBox.warning(
             self,
@@ -432,7 +488,9 @@ class MainWindow(QtWidgets.QMainWindow):
     def update_button_states(self):
         """Update button states based on current activity"""
         recording_or_playing = self.recording_active or self.is_playing
-        self.play_button.setEnabled(not recording_or_playing)
+        # While playing, the play button stops the macro
+        self.play_button.setEnabled(not self.recording_active)
+        self.play_button.setText("■ Stop" if self.is_playing else "▶ Play")
         self.save_button.setEnabled(not recording_or_playing)
         self.record_button.setEnabled(not self.is_playing)
             
@@ -470,6 +528,13 @@ class MainWindow(QtWidgets.QMainWindow):
             with open(main_file, 'w', encoding='utf-8') as f:
                 f.write(self.code_text.toPlainText())
             
+            # Generated code runs on the shared playback runtime
+            self.recorder.macro_generator.export_runtime(project_path)
+            
+            # Save raw events so the macro can be inspected or regenerated later
+            if self.recorder.actions:
+                self.recorder.save_recording(project_path / "recording.pamr")
+            
             QtWidgets.QMessageBox.information(
                 self, 
                 "Success", 
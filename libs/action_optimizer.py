@@ -0,0 +1,143 @@
+import abc
+import time
+import logging
+
+# Positional actions whose first two arguments are the x, y the pointer ends up at
+POINTER_ACTIONS = ('move', 'mouseDown', 'mouseUp', 'click', 'scroll', 'doubleClick', 'tripleClick', 'longPress')
+
+def _same_spot(a, b, tolerance):
+    return abs(a[1] - b[1]) <= tolerance and abs(a[2] - b[2]) <= tolerance
+
+class OptimizerPass(abc.ABC):
+    """One rewrite over the action list; subclasses implement `apply`"""
+    name = 'pass'
+
+    def config(self):
+        """Parameters that change the output, for cache fingerprints"""
+        return tuple(sorted(vars(self).items()))
+
+    @abc.abstractmethod
+    def apply(self, actions):
+        """Returns the rewritten list of actions"""
+
+class RemoveRedundantMoves(OptimizerPass):
+    """Drops a move when the next action puts the pointer at the same spot anyway"""
+    name = 'redundant-moves'
+
+    def __init__(self, tolerance=2):
+        self.tolerance = tolerance
+
+    def apply(self, actions):
+        result = []
+        for index, action in enumerate(actions):
+            if action[0] == 'move' and index + 1 < len(actions):
+                following = actions[index + 1]
+                if (following[0] in POINTER_ACTIONS or following[0] == 'drag') and \
+                        _same_spot(action, following, self.tolerance):
+                    continue
+            result.append(action)
+        return result
+
+class MergeClicks(OptimizerPass):
+    """Turns a mouseDown directly followed by its mouseUp at the same spot into one click"""
+    name = 'merge-clicks'
+
+    def __init__(self, tolerance=2):
+        self.tolerance = tolerance
+
+    def apply(self, actions):
+        result = []
+        index = 0
+        while index < len(actions):
+            action = actions[index]
+            if action[0] == 'mouseDown' and index + 1 < len(actions):
+                up = actions[index + 1]
+                if up[0] == 'mouseUp' and up[3] == action[3] and _same_spot(action, up, self.tolerance):
+                    _, x, y, button, timestamp, screenshot = action
+                    result.append(('click', x, y, button, timestamp, screenshot))
+                    index += 2
+                    continue
+            result.append(action)
+            index += 1
+        return result
+
+class CoalesceScrolls(OptimizerPass):
+    """Sums consecutive scrolls at the same spot into one scroll"""
+    name = 'coalesce-scrolls'
+
+    def __init__(self, tolerance=2, max_gap=0.5):
+        self.tolerance = tolerance
+        self.max_gap = max_gap  # Scrolls further apart stay separate gestures
+
+    def apply(self, actions):
+        result = []
+        last_time = None
+        for action in actions:
+            if action[0] == 'scroll' and result and result[-1][0] == 'scroll':
+                previous = result[-1]
+                if (_same_spot(previous, action, self.tolerance) and previous[4] * action[4] > 0
+                        and action[5] - last_time <= self.max_gap):
+                    result[-1] = previous[:4] + (previous[4] + action[4], previous[5])
+                    last_time = action[5]
+                    continue
+            if action[0] == 'scroll':
+                last_time = action[5]
+            result.append(action)
+        return result
+
+class DropNoOps(OptimizerPass):
+    """Drops actions with nothing to do: a move to where the previous move left
+    the pointer, zero scrolls and empty text.
+
+    Waits are not actions: the generator derives each row's wait from the
+    timestamp gap, and TimingPolicy skips waits up to `min_sleep` at playback,
+    so zero-length waits never reach a macro."""
+    name = 'drop-no-ops'
+
+    def apply(self, actions):
+        result = []
+        pointer = None
+        for action in actions:
+            kind = action[0]
+            if kind == 'move' and pointer == (action[1], action[2]):
+                continue
+            if kind == 'scroll' and action[4] == 0:
+                continue
+            if kind == 'write' and not action[1]:
+                continue
+            if kind == 'move':
+                pointer = (action[1], action[2])
+            elif kind in POINTER_ACTIONS or kind == 'drag':
+                pointer = None  # Clicks on a template may land away from the recorded spot
+            result.append(action)
+        return result
+
+def default_passes():
+    return [DropNoOps(), RemoveRedundantMoves(), MergeClicks(), CoalesceScrolls()]
+
+class ActionOptimizer:
+    """Ordered pipeline of optimizer passes run over actions before code generation.
+
+    After every run `stats` holds (pass name, actions removed, seconds) for
+    each pass.
+    """
+    def __init__(self, passes=None):
+        self.passes = default_passes() if passes is None else list(passes)
+        self.stats = []
+
+    def config(self):
+        return tuple((p.name, p.config()) for p in self.passes)
+
+    def optimize(self, actions):
+        actions = list(actions)
+        self.stats = []
+        for optimizer_pass in self.passes:
+            started = time.perf_counter()
+            before = len(actions)
+            actions = optimizer_pass.apply(actions)
+            self.stats.append((optimizer_pass.name, before - len(actions), time.perf_counter() - started))
+        return actions
+
+    def log_stats(self):
+        for name, removed, seconds in self.stats:
+            logging.debug(f"Optimizer pass {name}: removed {removed} actions in {seconds * 1000:.2f}ms")
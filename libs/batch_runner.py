@@ -0,0 +1,205 @@
+"""Headless runner for saved projects.
+
+Runs many project directories (each with main.py, screens/ and its copy of
+macro_runtime) as a job queue, one macro per X display at a time:
+
+    python -m libs.batch_runner projects/* --displays 4 --report report.json
+
+Xvfb displays are started for the run unless existing ones are given with
+--display. Every job gets a report entry with its exit status, duration
+and the step it failed on.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Runs a project's main.py in the job process and records the last step reached.
+# The result is rewritten before every step, so it survives the job being killed.
+BOOTSTRAP = r'''
+import sys, os, json, runpy, traceback
+project, result_path = sys.argv[1], sys.argv[2]
+os.chdir(project)
+sys.path.insert(0, project)
+state = {'step': None, 'total': None, 'op': None, 'error': None}
+def save():
+    with open(result_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(result_path + '.tmp', result_path)
+def observe(index, total, op):
+    state['step'], state['total'], state['op'] = index, total, op
+    save()
+try:
+    import macro_runtime
+    if hasattr(macro_runtime, 'set_observer'):
+        macro_runtime.set_observer(observe)
+    runpy.run_path('main.py', run_name='__main__')
+except SystemExit as e:
+    if e.code not in (None, 0):
+        state['error'] = f'SystemExit({e.code!r})'
+    raise
+except BaseException as e:
+    state['error'] = ''.join(traceback.format_exception_only(type(e), e)).strip()
+    traceback.print_exc()
+    raise SystemExit(1)
+finally:
+    save()
+'''
+
+class XvfbDisplay:
+    """One virtual X server started for the batch"""
+    def __init__(self, number, size=(1920, 1080), depth=24):
+        self.number = number
+        self.size = size
+        self.depth = depth
+        self.process = None
+
+    @property
+    def name(self):
+        return f":{self.number}"
+
+    def start(self, timeout=10.0):
+        socket = Path(f"/tmp/.X11-unix/X{self.number}")
+        self.process = subprocess.Popen(
+            ['Xvfb', self.name, '-screen', '0', f"{self.size[0]}x{self.size[1]}x{self.depth}", '-nolisten', 'tcp'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        while not socket.exists():
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Xvfb {self.name} exited with code {self.process.returncode}")
+            if time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"Xvfb {self.name} did not start within {timeout}s")
+            time.sleep(0.05)
+        logging.info(f"Started Xvfb display {self.name}")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+def start_displays(count, first=99, size=(1920, 1080)):
+    """Starts `count` Xvfb servers on free display numbers from `first` on"""
+    if not shutil.which('Xvfb'):
+        raise RuntimeError("Xvfb not found; install it or pass existing displays with --display")
+    displays = []
+    number = first
+    try:
+        while len(displays) < count:
+            if not Path(f"/tmp/.X11-unix/X{number}").exists() and not Path(f"/tmp/.X{number}-lock").exists():
+                display = XvfbDisplay(number, size)
+                display.start()
+                displays.append(display)
+            number += 1
+    except Exception:
+        for display in displays:
+            display.stop()
+        raise
+    return displays
+
+def run_job(project, display, timeout=None):
+    """Plays one project on a display and returns its report entry"""
+    project = Path(project).resolve()
+    entry = {'project': str(project), 'display': display, 'status': None, 'exit_code': None,
+             'duration': None, 'step': None, 'total': None, 'op': None, 'error': None,
+             'log': str(project / 'batch.log')}
+    if not (project / 'main.py').exists():
+        entry.update(status='invalid', duration=0.0, error='main.py not found')
+        return entry
+
+    env = dict(os.environ, DISPLAY=display)
+    with tempfile.TemporaryDirectory(prefix='macro-job-') as tmp:
+        result_path = Path(tmp) / 'result.json'
+        started = time.monotonic()
+        with open(entry['log'], 'w', encoding='utf-8') as log:
+            try:
+                completed = subprocess.run([sys.executable, '-c', BOOTSTRAP, str(project), str(result_path)],
+                                           cwd=project, env=env, stdout=log, stderr=subprocess.STDOUT,
+                                           timeout=timeout)
+                entry['exit_code'] = completed.returncode
+                entry['status'] = 'passed' if completed.returncode == 0 else 'failed'
+            except subprocess.TimeoutExpired:
+                entry.update(status='timeout', error=f"Timed out after {timeout}s")
+        entry['duration'] = round(time.monotonic() - started, 3)
+        if result_path.exists():
+            state = json.loads(result_path.read_text(encoding='utf-8'))
+            entry.update({key: value for key, value in state.items() if value is not None})
+    return entry
+
+def run_batch(projects, displays, timeout=None):
+    """Runs projects as a queue over the given DISPLAY names, one job per display at a time"""
+    free = queue.Queue()
+    for display in displays:
+        free.put(display)
+
+    def job(project):
+        display = free.get()
+        try:
+            entry = run_job(project, display, timeout)
+        finally:
+            free.put(display)
+        logging.info(f"{entry['status']}: {entry['project']} on {display} in {entry['duration']}s")
+        return entry
+
+    with ThreadPoolExecutor(max_workers=len(displays)) as pool:
+        return list(pool.map(job, projects))
+
+def format_report(entries):
+    lines = []
+    for entry in entries:
+        line = f"{entry['status']:8} {entry['duration'] or 0:8.2f}s  {entry['project']}"
+        if entry['status'] != 'passed':
+            if entry['step'] is not None:
+                line += f"  (step {entry['step'] + 1}/{entry['total']} {entry['op']})"
+            if entry['error']:
+                line += f"  {entry['error']}"
+        lines.append(line)
+    passed = sum(entry['status'] == 'passed' for entry in entries)
+    lines.append(f"{passed}/{len(entries)} projects passed")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run saved macro projects headless on Xvfb displays")
+    parser.add_argument('projects', nargs='+', help="saved project directories")
+    parser.add_argument('--displays', type=int, default=os.cpu_count() or 1,
+                        help="number of Xvfb displays to start (default: CPU count)")
+    parser.add_argument('--display', action='append', dest='existing',
+                        help="use this running display instead of starting Xvfb; may be repeated")
+    parser.add_argument('--screen', default='1920x1080', help="Xvfb screen size (default: 1920x1080)")
+    parser.add_argument('--timeout', type=float, default=None, help="seconds before a job is killed")
+    parser.add_argument('--report', help="write the job report as JSON to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    xvfb = []
+    if args.existing:
+        displays = args.existing
+    else:
+        size = tuple(int(value) for value in args.screen.lower().split('x'))
+        xvfb = start_displays(min(args.displays, len(args.projects)), size=size)
+        displays = [display.name for display in xvfb]
+    try:
+        entries = run_batch(args.projects, displays, args.timeout)
+    finally:
+        for display in xvfb:
+            display.stop()
+
+    print(format_report(entries))
+    if args.report:
+        Path(args.report).write_text(json.dumps(entries, indent=2), encoding='utf-8')
+    return 0 if all(entry['status'] == 'passed' for entry in entries) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import time
+
+# Single monotonic, high-resolution clock used by every capture path
+now_ns = time.perf_counter_ns
+
+class EventClock:
+    """Monotonic nanosecond clock anchored at the start of a recording session"""
+    def __init__(self):
+        self.origin_ns = None
+
+    def start(self):
+        self.origin_ns = now_ns()
+        return self.origin_ns
+
+    def stop(self):
+        self.origin_ns = None
+
+    @property
+    def running(self):
+        return self.origin_ns is not None
+
+    def elapsed(self, stamp_ns):
+        """Seconds between the session start and a now_ns() stamp"""
+        return (stamp_ns - self.origin_ns) / 1e9
+
+class LatencyHistogram:
+    """Log-linear histogram of nanosecond latencies (8 sub-buckets per power of two)"""
+    BUCKETS = 8 * 64
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.max_ns = 0
+
+    @staticmethod
+    def _bucket(value):
+        if value < 16:
+            return max(value, 0)
+        shift = value.bit_length() - 4
+        return (shift << 3) + (value >> shift)
+
+    @staticmethod
+    def _bucket_upper(bucket):
+        if bucket < 16:
+            return bucket
+        shift = (bucket >> 3) - 1
+        mantissa = bucket - (shift << 3)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, latency_ns):
+        self.counts[min(self._bucket(latency_ns), self.BUCKETS - 1)] += 1
+        self.count += 1
+        if latency_ns > self.max_ns:
+            self.max_ns = latency_ns
+
+    def percentile(self, percent):
+        """Upper bound (ns) of the bucket holding the given percentile"""
+        if not self.count:
+            return 0
+        target = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(self._bucket_upper(bucket), self.max_ns)
+        return self.max_ns
+
+    def summary(self):
+        """Returns count and p50/p99/max in milliseconds"""
+        return {
+            'count': self.count,
+            'p50_ms': self.percentile(50) / 1e6,
+            'p99_ms': self.percentile(99) / 1e6,
+            'max_ms': self.max_ns / 1e6,
+        }
@@ -0,0 +1,215 @@
+import os
+import struct
+import threading
+import logging
+from array import array
+
+MAGIC = b'PAMJ\x01'
+
+# Record kinds; every record starts with one of these bytes
+EVENT_RECORD = b'E'
+STRING_RECORD = b'S'
+SEGMENT_RECORD = b'G'
+ALIAS_RECORD = b'A'
+
+# type, timestamp, x, y, button id, extra, screenshot id, dispatch ns, accept ns
+EVENT_STRUCT = struct.Struct('<bdiihiiqq')
+STRING_HEADER = struct.Struct('<iH')
+SEGMENT_STRUCT = struct.Struct('<i')
+ALIAS_STRUCT = struct.Struct('<ii')
+
+# Every CHECKPOINT_EVERY events the file offset is remembered for random reads
+CHECKPOINT_EVERY = 4096
+
+class EventJournal:
+    """Crash-safe append-only journal of recorded events.
+
+    Records are collected in a bounded write buffer that is flushed when it
+    fills up and fsync'ed periodically by a background thread, so at most
+    `fsync_interval` seconds of input are lost if the process dies. The file
+    is removed on a clean close; one that is still present at start-up
+    belongs to a session that did not exit cleanly and can be replayed.
+    """
+    def __init__(self, path, fsync_interval=1.0, max_buffer=64 * 1024):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.max_buffer = max_buffer
+        self.lock = threading.Lock()
+        self.buffer = bytearray()
+        self.file = None
+        self.position = 0  # Logical end of the journal, including buffered bytes
+        self.event_count = 0
+        self.checkpoints = array('q')
+        self.stop_event = threading.Event()
+        self.sync_thread = None
+
+    @property
+    def is_open(self):
+        return self.file is not None
+
+    def open(self):
+        """Creates a new journal, or continues an existing one after recovery"""
+        if self.file:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.file = open(self.path, 'ab')
+            self.position = self.file.tell()
+        else:
+            self.file = open(self.path, 'wb')
+            self.file.write(MAGIC)
+            self.position = len(MAGIC)
+            self.event_count = 0
+            self.checkpoints = array('q')
+        self.stop_event.clear()
+        self.sync_thread = threading.Thread(target=self._sync_loop, name="journal-sync", daemon=True)
+        self.sync_thread.start()
+        logging.info(f"Event journal opened: {self.path}")
+
+    def close(self, remove=True):
+        """Flushes and closes the journal; removes the file unless told otherwise"""
+        if not self.file:
+            return
+        self.stop_event.set()
+        if self.sync_thread:
+            self.sync_thread.join()
+            self.sync_thread = None
+        with self.lock:
+            self._write_buffer()
+            self.file.close()
+            self.file = None
+        if remove and self.path.exists():
+            self.path.unlink()
+        self.event_count = 0
+        self.checkpoints = array('q')
+        logging.info(f"Event journal closed: {self.path}")
+
+    def _append_record(self, data):
+        with self.lock:
+            self.buffer += data
+            self.position += len(data)
+            if len(self.buffer) >= self.max_buffer:
+                self._write_buffer()
+
+    def write_event(self, type_code, timestamp, x, y, button, extra, screenshot, dispatch_ns, accept_ns):
+        if self.event_count % CHECKPOINT_EVERY == 0:
+            self.checkpoints.append(self.position)
+        self.event_count += 1
+        self._append_record(EVENT_RECORD + EVENT_STRUCT.pack(
+            type_code, timestamp, x, y, button, extra, screenshot, dispatch_ns, accept_ns))
+
+    def write_string(self, string_id, value):
+        encoded = value.encode('utf-8')
+        self._append_record(STRING_RECORD + STRING_HEADER.pack(string_id, len(encoded)) + encoded)
+
+    def write_segment(self, start_row):
+        self._append_record(SEGMENT_RECORD + SEGMENT_STRUCT.pack(start_row))
+
+    def write_alias(self, screenshot_num, existing_num):
+        self._append_record(ALIAS_RECORD + ALIAS_STRUCT.pack(screenshot_num, existing_num))
+
+    def flush(self):
+        """Hands buffered records to the OS so they can be read back"""
+        with self.lock:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        if self.buffer and self.file:
+            self.file.write(self.buffer)
+            self.file.flush()
+            self.buffer = bytearray()
+
+    def _sync_loop(self):
+        while not self.stop_event.wait(self.fsync_interval):
+            try:
+                with self.lock:
+                    self._write_buffer()
+                    if self.file:
+                        os.fsync(self.file.fileno())
+            except Exception as e:
+                logging.exception(f"Error syncing event journal: {e}")
+
+    def read_events(self, start, stop):
+        """Yields raw event fields for event rows start..stop-1 already written to the file"""
+        if start >= stop:
+            return
+        checkpoint = start // CHECKPOINT_EVERY
+        row = checkpoint * CHECKPOINT_EVERY
+        with open(self.path, 'rb') as f:
+            f.seek(self.checkpoints[checkpoint])
+            for kind, fields in _read_records(f):
+                if kind != EVENT_RECORD:
+                    continue
+                if row >= stop:
+                    return
+                if row >= start:
+                    yield fields
+                row += 1
+
+    @staticmethod
+    def replay(path):
+        """Reads an unclean journal.
+
+        Returns (events, strings, screenshot aliases, segment starts,
+        checkpoints, valid length); a torn record at the end is ignored.
+        """
+        events = []
+        strings = {}
+        aliases = {}
+        segments = []
+        checkpoints = array('q')
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an event journal")
+            valid_length = f.tell()
+            for kind, fields in _read_records(f):
+                if kind == EVENT_RECORD:
+                    if len(events) % CHECKPOINT_EVERY == 0:
+                        checkpoints.append(valid_length)
+                    events.append(fields)
+                elif kind == STRING_RECORD:
+                    strings[fields[0]] = fields[1]
+                elif kind == SEGMENT_RECORD:
+                    segments.append(fields[0])
+                elif kind == ALIAS_RECORD:
+                    aliases[fields[0]] = fields[1]
+                valid_length = f.tell()
+        return events, strings, aliases, segments, checkpoints, valid_length
+
+    def restore(self, valid_length, event_count, checkpoints):
+        """Drops a torn tail and resumes appending after recovery"""
+        with open(self.path, 'r+b') as f:
+            f.truncate(valid_length)
+        self.event_count = event_count
+        self.checkpoints = checkpoints
+
+def _read_records(f):
+    """Yields (kind, fields) until the end of the file or a torn record"""
+    while True:
+        kind = f.read(1)
+        if kind == EVENT_RECORD:
+            data = f.read(EVENT_STRUCT.size)
+            if len(data) < EVENT_STRUCT.size:
+                return
+            yield kind, EVENT_STRUCT.unpack(data)
+        elif kind == STRING_RECORD:
+            header = f.read(STRING_HEADER.size)
+            if len(header) < STRING_HEADER.size:
+                return
+            string_id, length = STRING_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield kind, (string_id, data.decode('utf-8'))
+        elif kind == SEGMENT_RECORD:
+            data = f.read(SEGMENT_STRUCT.size)
+            if len(data) < SEGMENT_STRUCT.size:
+                return
+            yield kind, SEGMENT_STRUCT.unpack(data)
+        elif kind == ALIAS_RECORD:
+            data = f.read(ALIAS_STRUCT.size)
+            if len(data) < ALIAS_STRUCT.size:
+                return
+            yield kind, ALIAS_STRUCT.unpack(data)
+        else:
+            return
@@ -0,0 +1,109 @@
+import threading
+import logging
+from collections import deque
+
+class EventMerger:
+    """Timestamp-ordered merge of events from several input sources.
+
+    Every source gets its own queue, filled by its listener thread (the
+    keyboard thread also flushes moves the mouse recorder holds back, under
+    that recorder's lock), so producers never contend with the store;
+    `deque.append`/`popleft` are atomic and need no lock. A merge thread
+    wakes every `interval` seconds and hands queued events to `sink` in
+    timestamp order once they are older than `reorder_window`, which gives
+    late deliveries from the other source time to arrive.
+
+    A source may report, through `hold_back`, the oldest timestamp it may
+    still produce (the mouse recorder holds points back while simplifying a
+    path); merging waits for it, but never longer than `max_hold`. An event
+    that still arrives after newer ones were merged is clamped to the merge
+    frontier so the store stays in order.
+    """
+    def __init__(self, sink, now, reorder_window=0.05, interval=0.01, max_hold=1.0):
+        self.sink = sink  # sink(source, timestamp, event)
+        self.now = now  # Current time on the recording clock, in seconds
+        self.reorder_window = reorder_window
+        self.interval = interval
+        self.max_hold = max_hold
+        self.queues = {}
+        self.heads = {}
+        self.hold_backs = {}
+        self.frontier = 0.0
+        self.late = 0
+        self.merged = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def add_source(self, name, hold_back=None):
+        """Registers a source and returns the queue its producer appends (timestamp, event) to"""
+        queue = self.queues[name] = deque()
+        self.heads[name] = deque()
+        if hold_back:
+            self.hold_backs[name] = hold_back
+        return queue
+
+    def start(self):
+        if self.thread:
+            return
+        for queue in self.queues.values():
+            queue.clear()
+        for heads in self.heads.values():
+            heads.clear()
+        self.frontier = 0.0
+        self.late = 0
+        self.merged = 0
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="event-merger", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the merge thread after merging everything still queued"""
+        if not self.thread:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        if self.late:
+            logging.info(f"Merged {self.merged} events, {self.late} arrived outside the reorder window")
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.drain(self.now() - self.reorder_window)
+            except Exception as e:
+                logging.exception(f"Error merging events: {e}")
+        self.drain(None)
+
+    def drain(self, until):
+        """Merges queued events up to timestamp `until`, or all of them if None"""
+        for name, queue in self.queues.items():
+            heads = self.heads[name]
+            while queue:
+                heads.append(queue.popleft())
+
+        limit = until
+        if until is not None:
+            for hold_back in self.hold_backs.values():
+                oldest = hold_back()
+                if oldest is not None and oldest > until - self.max_hold:
+                    limit = min(limit, oldest)
+
+        heads = list(self.heads.items())
+        while True:
+            source = None
+            for name, pending in heads:
+                if pending and (source is None or pending[0][0] < source[1][0][0]):
+                    source = (name, pending)
+            if source is None:
+                return
+            name, pending = source
+            timestamp = pending[0][0]
+            if limit is not None and timestamp > limit:
+                return
+            timestamp, event = pending.popleft()
+            if timestamp < self.frontier:
+                self.late += 1
+                timestamp = self.frontier
+            self.frontier = timestamp
+            self.merged += 1
+            self.sink(name, timestamp, event)
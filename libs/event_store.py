@@ -0,0 +1,207 @@
+import threading
+import logging
+from array import array
+
+# Type codes stored in the columnar type array
+EVENT_TYPES = ('move', 'mouseDown', 'mouseUp', 'scroll', 'keydown', 'keyup')
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+NO_SCREENSHOT = -1
+
+class EventStore:
+    """Append-only columnar storage for recorded input events.
+
+    Each event is one row across typed arrays (timestamp, x, y, type, button,
+    extra, plus the listener-dispatch and recorder-accept clock stamps).
+    Key and button names live in an interned string table and screenshot ids
+    in a sparse side table, so no per-event Python object is kept until the
+    events are read back as action tuples. Screenshot ids found to duplicate
+    an earlier template are read back as that template's id.
+
+    With a journal attached every row is also streamed to disk, and once more
+    than `max_resident` rows are held in memory the oldest ones are dropped
+    from RAM and read back from the journal when needed.
+    """
+    def __init__(self, journal=None, max_resident=250000):
+        self.lock = threading.RLock()
+        self.journal = journal
+        self.max_resident = max_resident
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.timestamps = array('d')
+            self.xs = array('i')
+            self.ys = array('i')
+            self.types = array('b')
+            self.buttons = array('h')
+            self.extra = array('i')  # scroll delta or key string id
+            self.dispatch_ns = array('q')  # when the listener callback saw the event
+            self.accept_ns = array('q')  # when the recorder accepted it
+            self.screenshots = {}  # row -> screenshot id
+            self.screenshot_aliases = {}  # duplicate screenshot id -> shared template id
+            self.strings = []
+            self.string_ids = {}
+            self.count = 0
+            self.spilled = 0  # Rows before this index only live in the journal
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    def __iter__(self):
+        return self.iter_actions(0, self.count)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                raise ValueError("EventStore slices do not support a step")
+            return EventStoreView(self, start, max(start, stop))
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("event index out of range")
+        return next(self.iter_actions(index, index + 1))
+
+    def _intern(self, value):
+        with self.lock:
+            string_id = self.string_ids.get(value)
+            if string_id is None:
+                string_id = len(self.strings)
+                self.strings.append(value)
+                self.string_ids[value] = string_id
+                if self.journal:
+                    self.journal.write_string(string_id, value)
+            return string_id
+
+    def _append(self, type_code, timestamp, x, y, button, extra, dispatch_ns, accept_ns, screenshot=None):
+        with self.lock:
+            self.timestamps.append(timestamp)
+            self.xs.append(x)
+            self.ys.append(y)
+            self.buttons.append(button)
+            self.extra.append(extra)
+            self.dispatch_ns.append(dispatch_ns)
+            self.accept_ns.append(accept_ns)
+            self.types.append(type_code)
+            if screenshot is not None:
+                self.screenshots[self.count] = screenshot
+            if self.journal:
+                self.journal.write_event(type_code, timestamp, x, y, button, extra,
+                                         NO_SCREENSHOT if screenshot is None else screenshot,
+                                         dispatch_ns, accept_ns)
+            self.count += 1
+            if self.journal and self.count - self.spilled > self.max_resident:
+                self._spill(self.max_resident // 2)
+
+    def append_move(self, x, y, timestamp, dispatch_ns=0, accept_ns=0):
+        self._append(0, timestamp, int(round(x)), int(round(y)), -1, 0, dispatch_ns, accept_ns)
+
+    def append_button(self, event_type, x, y, button, timestamp, screenshot=None, dispatch_ns=0, accept_ns=0):
+        if event_type != 'mouseDown':
+            screenshot = None
+        self._append(EVENT_CODES[event_type], timestamp, int(round(x)), int(round(y)),
+                     self._intern(button), 0, dispatch_ns, accept_ns, screenshot)
+
+    def append_scroll(self, x, y, delta, timestamp, dispatch_ns=0, accept_ns=0):
+        self._append(3, timestamp, int(round(x)), int(round(y)), -1, int(delta), dispatch_ns, accept_ns)
+
+    def append_key(self, event_type, key, timestamp, dispatch_ns=0, accept_ns=0):
+        self._append(EVENT_CODES[event_type], timestamp, 0, 0, -1, self._intern(key), dispatch_ns, accept_ns)
+
+    def alias_screenshot(self, screenshot_num, existing_num):
+        """Points a duplicate screenshot id at an earlier, identical template"""
+        with self.lock:
+            self.screenshot_aliases[screenshot_num] = existing_num
+            if self.journal:
+                self.journal.write_alias(screenshot_num, existing_num)
+
+    def screenshot_for(self, row):
+        screenshot = self.screenshots.get(row)
+        return self.screenshot_aliases.get(screenshot, screenshot)
+
+    def _spill(self, rows):
+        """Drops the oldest resident rows from memory; the journal keeps them"""
+        self.journal.flush()
+        for column in (self.timestamps, self.xs, self.ys, self.types, self.buttons,
+                       self.extra, self.dispatch_ns, self.accept_ns):
+            del column[:rows]
+        self.spilled += rows
+        logging.debug(f"Spilled {rows} events to the journal ({self.spilled} on disk only)")
+
+    def _make_action(self, row, code, timestamp, x, y, button, extra):
+        if code == 0:
+            return ('move', x, y, timestamp)
+        if code == 1:
+            return ('mouseDown', x, y, self.strings[button], timestamp, self.screenshot_for(row))
+        if code == 2:
+            return ('mouseUp', x, y, self.strings[button], timestamp)
+        if code == 3:
+            return ('scroll', x, y, 0, extra, timestamp)
+        return (EVENT_TYPES[code], self.strings[extra], timestamp)
+
+    def action_at(self, row):
+        """Materializes one resident row as a legacy action tuple"""
+        i = row - self.spilled
+        return self._make_action(row, self.types[i], self.timestamps[i], self.xs[i], self.ys[i],
+                                 self.buttons[i], self.extra[i])
+
+    def iter_actions(self, start, stop):
+        stop = min(stop, self.count)
+        row = start
+        if row < self.spilled:
+            for fields in self.journal.read_events(row, min(stop, self.spilled)):
+                code, timestamp, x, y, button, extra = fields[:6]
+                yield self._make_action(row, code, timestamp, x, y, button, extra)
+                row += 1
+        for row in range(max(row, self.spilled), stop):
+            yield self.action_at(row)
+
+    def load_journal_events(self, events, strings, aliases, screenshot_ok):
+        """Rebuilds rows from replayed journal records without writing them again"""
+        journal = self.journal
+        self.journal = None
+        try:
+            for string_id in sorted(strings):
+                self._intern(strings[string_id])
+            self.screenshot_aliases.update(aliases)
+            for code, timestamp, x, y, button, extra, screenshot, dispatch_ns, accept_ns in events:
+                if screenshot == NO_SCREENSHOT or not screenshot_ok(aliases.get(screenshot, screenshot)):
+                    screenshot = None
+                self._append(code, timestamp, x, y, button, extra, dispatch_ns, accept_ns, screenshot)
+        finally:
+            self.journal = journal
+        with self.lock:
+            if self.journal and self.count - self.spilled > self.max_resident:
+                self._spill(self.count - self.spilled - self.max_resident // 2)
+
+class EventStoreView:
+    """Read-only window over a range of rows in an EventStore"""
+    def __init__(self, store, start, stop):
+        self.store = store
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __bool__(self):
+        return self.stop > self.start
+
+    def __iter__(self):
+        return self.store.iter_actions(self.start, self.stop)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("EventStore slices do not support a step")
+            return EventStoreView(self.store, self.start + start, self.start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("event index out of range")
+        return next(self.store.iter_actions(self.start + index, self.start + index + 1))
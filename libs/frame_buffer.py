@@ -0,0 +1,78 @@
+import threading
+import logging
+import pyautogui
+
+# Handle both package and direct script usage
+try:
+    from .event_clock import now_ns
+except ImportError:
+    from event_clock import now_ns
+
+class FrameRingBuffer:
+    """Low-rate full-screen grabber that keeps the most recent frames.
+
+    Slots are allocated once; the grab thread overwrites the oldest slot so
+    a click can be cropped from the frame taken just before it happened.
+    """
+    def __init__(self, capacity=4, interval=0.2, max_age=1.0):
+        self.capacity = capacity
+        self.interval = interval
+        self.max_age = max_age
+        self.timestamps = [0] * capacity  # now_ns() stamps
+        self.frames = [None] * capacity
+        self.next_slot = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        logging.info("FrameRingBuffer initialized")
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.clear()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self.thread.start()
+        logging.debug(f"Frame grabber started ({self.capacity} slots, {self.interval}s interval)")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.clear()
+        logging.info("Frame grabber stopped")
+
+    def clear(self):
+        with self.lock:
+            for slot in range(self.capacity):
+                self.timestamps[slot] = 0
+                self.frames[slot] = None
+            self.next_slot = 0
+
+    def frame_before(self, timestamp):
+        """Returns the newest frame grabbed at or before a now_ns() stamp, or None"""
+        best_slot = None
+        with self.lock:
+            for slot in range(self.capacity):
+                grabbed_at = self.timestamps[slot]
+                if self.frames[slot] is None or grabbed_at > timestamp:
+                    continue
+                if best_slot is None or grabbed_at > self.timestamps[best_slot]:
+                    best_slot = slot
+            if best_slot is None or timestamp - self.timestamps[best_slot] > self.max_age * 1e9:
+                return None
+            return self.frames[best_slot]
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            started = now_ns()
+            try:
+                frame = pyautogui.screenshot()
+                with self.lock:
+                    self.frames[self.next_slot] = frame
+                    self.timestamps[self.next_slot] = started
+                    self.next_slot = (self.next_slot + 1) % self.capacity
+            except Exception as e:
+                logging.exception(f"Error grabbing frame: {e}")
+            self.stop_event.wait(max(0.0, self.interval - (now_ns() - started) / 1e9))
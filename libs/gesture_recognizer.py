@@ -0,0 +1,165 @@
+# Handle both package and direct script usage
+try:
+    from .path_simplifier import _segment_distance
+except ImportError:
+    from path_simplifier import _segment_distance
+
+# Presses of the left button this close in time and space form one multi-click
+MULTI_CLICK_INTERVAL = 0.5
+MULTI_CLICK_DISTANCE = 4
+# Pointer travel while pressed that turns a click into a drag
+DRAG_SLOP = 4
+# Seconds a press without travel must be held to become a long press
+LONG_PRESS = 0.8
+
+class GestureRecognizer:
+    """Streaming state machine that folds raw mouse events into gestures.
+
+    Emitted actions, with the screenshot of the first press last:
+        ('doubleClick', x, y, t, screenshot)
+        ('tripleClick', x, y, t, screenshot)
+        ('drag', x, y, button, path, duration, t, screenshot)
+        ('longPress', x, y, button, duration, t, screenshot)
+    A drag path is a tuple of (dx, dy, seconds) steps relative to the press
+    position; a drag that stays within `straight_tolerance` pixels of the
+    line from press to release is a single step. Single clicks, and presses
+    interrupted by a keyboard event or another button, are passed through
+    as the raw events.
+    """
+    def __init__(self, drag_slop=DRAG_SLOP, long_press=LONG_PRESS, straight_tolerance=2.0):
+        self.drag_slop = drag_slop
+        self.long_press = long_press
+        self.straight_tolerance = straight_tolerance
+        self.gestures = 0
+        self.reset()
+
+    def reset(self):
+        self.press = None  # [mouseDown action, moves while pressed, dragged]
+        self.clicks = []  # (mouseDown, mouseUp) of the pending multi-click
+        self.raw_buttons = set()  # Buttons whose release passes through unchanged
+        self.output = []
+
+    def add(self, action):
+        """Feeds one action; returns the list of actions ready to be generated"""
+        self._add(action)
+        output, self.output = self.output, []
+        return output
+
+    def _add(self, action):
+        kind = action[0]
+        if self.press is not None:
+            self._add_pressed(action)
+        elif kind == 'mouseDown':
+            if self.clicks and not self._continues_clicks(action):
+                self._finish_clicks()
+            self.press = [action, [], False]
+        elif kind == 'move' and self.clicks and self._within(self.clicks[0][0], action[1], action[2], MULTI_CLICK_DISTANCE):
+            pass  # Jitter between the clicks of a multi-click
+        elif kind == 'mouseUp' and action[3] in self.raw_buttons:
+            self.raw_buttons.discard(action[3])
+            self._finish_clicks()
+            self.output.append(action)
+        else:
+            self._finish_clicks()
+            self.output.append(action)
+
+    def finish(self):
+        """Releases everything still pending at the end of the recording"""
+        if self.press is not None:
+            self._abort_press()
+        self._finish_clicks()
+        output = self.output
+        self.reset()
+        return output
+
+    def recognize(self, actions):
+        """Generator over a whole action sequence"""
+        self.reset()
+        self.gestures = 0
+        for action in actions:
+            yield from self.add(action)
+        yield from self.finish()
+
+    def _continues_clicks(self, down):
+        last_down = self.clicks[-1][0]
+        return (down[3] == 'left' and down[4] - last_down[4] <= MULTI_CLICK_INTERVAL
+                and self._within(self.clicks[0][0], down[1], down[2], MULTI_CLICK_DISTANCE))
+
+    def _add_pressed(self, action):
+        down, moves, dragged = self.press
+        kind = action[0]
+        if kind == 'move':
+            moves.append(action)
+            if not dragged and not self._within(down, action[1], action[2], self.drag_slop):
+                self.press[2] = True
+        elif kind == 'mouseUp' and action[3] == down[3]:
+            self.press = None
+            self._release(down, moves, dragged, action)
+        else:
+            # Chorded buttons or keys while pressed: keep the raw events in order
+            self._abort_press()
+            self._add(action)
+
+    @staticmethod
+    def _within(down, x, y, distance):
+        return abs(x - down[1]) <= distance and abs(y - down[2]) <= distance
+
+    def _abort_press(self):
+        down, moves, _ = self.press
+        self.press = None
+        self._finish_clicks()
+        self.raw_buttons.add(down[3])
+        self.output.append(down)
+        self.output.extend(moves)
+
+    def _straight(self, path):
+        """True if every waypoint of a drag path lies near the line to its end"""
+        end_x, end_y, _ = path[-1]
+        return all(_segment_distance(dx, dy, 0, 0, end_x, end_y) <= self.straight_tolerance
+                   for dx, dy, _ in path[:-1])
+
+    def _release(self, down, moves, dragged, up):
+        _, x, y, button, t, screenshot = down
+        duration = round(up[4] - t, 3)
+        if (dragged or duration >= self.long_press) and screenshot is None and self.clicks:
+            # The recorder skips the capture of a press that may continue a multi-click;
+            # the first click's template shows the same spot
+            screenshot = self.clicks[0][0][5]
+        if dragged:
+            self._finish_clicks()
+            path = []
+            previous = t
+            for _, mx, my, mt in moves + [('move', up[1], up[2], up[4])]:
+                path.append((mx - x, my - y, round(mt - previous, 3)))
+                previous = mt
+            if self._straight(path):
+                path = [(path[-1][0], path[-1][1], duration)]
+            self._emit(('drag', x, y, button, tuple(path), duration, t, screenshot))
+        elif duration >= self.long_press:
+            self._finish_clicks()
+            self._emit(('longPress', x, y, button, duration, t, screenshot))
+        elif button != 'left':
+            self._finish_clicks()
+            self.output.append(down)
+            self.output.append(up)
+        else:
+            self.clicks.append((down, up))
+            if len(self.clicks) == 3:
+                self._finish_clicks()
+
+    def _finish_clicks(self):
+        clicks = self.clicks
+        if not clicks:
+            return
+        self.clicks = []
+        _, x, y, _, t, screenshot = clicks[0][0]
+        if len(clicks) == 1:
+            self.output.extend(clicks[0])
+        elif len(clicks) == 2:
+            self._emit(('doubleClick', x, y, t, screenshot))
+        else:
+            self._emit(('tripleClick', x, y, t, screenshot))
+
+    def _emit(self, action):
+        self.gestures += 1
+        self.output.append(action)
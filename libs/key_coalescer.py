@@ -0,0 +1,204 @@
+from collections import deque
+
+# Keys that only change what other keys do
+MODIFIERS = {
+    'shift', 'shiftleft', 'shiftright',
+    'ctrl', 'ctrlleft', 'ctrlright',
+    'alt', 'altleft', 'altright', 'alt_gr',
+    'option', 'optionleft', 'optionright',
+    'command', 'win', 'winleft', 'winright',
+}
+SHIFT_KEYS = {'shift', 'shiftleft', 'shiftright'}
+
+# Named keys that pyautogui.write() can type as characters
+TEXT_KEYS = {'space': ' ', 'return': '\n', 'enter': '\n', 'tab': '\t'}
+
+class KeyCoalescer:
+    """Streaming pass that turns raw keydown/keyup events into fewer, larger calls.
+
+    Consecutive printable keys become one ('write', text, interval, t) that
+    keeps the mean recorded cadence; shift plus a letter is typed as the
+    capital. A key pressed while modifiers are held becomes
+    ('hotkey', keys, t), repeated taps of the same named key become
+    ('press', key, presses, interval, t), and a key that auto-repeated
+    becomes ('hold', key, duration, repeats, t). Keys still held when a mouse action
+    arrives are passed through as raw keydown/keyup so the chord with the
+    mouse survives. Anything that is not a key event is passed unchanged.
+
+    Strokes are released in the order they were pressed, so rollover typing
+    (the next key down before the previous one is up) keeps its order.
+    """
+    def __init__(self, max_gap=1.0, repeat_threshold=2):
+        self.max_gap = max_gap  # Longer pauses split a text run and become sleeps
+        self.repeat_threshold = repeat_threshold
+        self.keys_in = 0
+        self.calls_out = 0
+        self.reset()
+
+    def reset(self):
+        self.pending = deque()  # strokes in press order: [key, mods, down, up, repeats, raw]
+        self.open = {}  # key -> stroke still held
+        self.modifiers = {}  # modifier -> [down, used in a chord, passed through raw]
+        self.text = []
+        self.text_times = []
+        self.taps = []  # (key, time) of repeated presses of one named key
+        self.output = []
+
+    def add(self, action):
+        """Feeds one action; returns the list of actions ready to be generated"""
+        kind = action[0]
+        if kind == 'keydown':
+            self.keys_in += 1
+            self._key_down(action[1], action[2])
+        elif kind == 'keyup':
+            self.keys_in += 1
+            self._key_up(action[1], action[2])
+        else:
+            self._pass_through_held(action)
+            self._flush_runs()
+            self._emit(action)
+        output, self.output = self.output, []
+        return output
+
+    def finish(self, timestamp=None):
+        """Releases everything still pending at the end of the recording"""
+        for stroke in self.pending:
+            if stroke[3] is None and not stroke[5]:
+                stroke[3] = stroke[2] if timestamp is None else max(stroke[2], timestamp)
+        self._release_closed()
+        for key, stroke in list(self.open.items()):
+            if stroke[5]:
+                self._emit(('keyup', key, stroke[2] if timestamp is None else timestamp))
+        for key, state in list(self.modifiers.items()):
+            if state[2]:
+                self._emit(('keyup', key, state[0] if timestamp is None else timestamp))
+        self._flush_runs()
+        output = self.output
+        self.reset()
+        return output
+
+    def coalesce(self, actions, timestamp_of=lambda action: action[-1]):
+        """Generator over a whole action sequence; `timestamp_of` reads an action's time"""
+        self.reset()
+        self.keys_in = 0
+        self.calls_out = 0
+        timestamp = None
+        for action in actions:
+            timestamp = timestamp_of(action)
+            yield from self.add(action)
+        yield from self.finish(timestamp)
+
+    def _key_down(self, key, timestamp):
+        if key in MODIFIERS:
+            if key not in self.modifiers:
+                self.modifiers[key] = [timestamp, False, False]
+            return
+        stroke = self.open.get(key)
+        if stroke is not None:
+            stroke[4] += 1  # Auto-repeat while held
+            return
+        # Modifiers already passed through raw are physically down at playback
+        mods = tuple(mod for mod, state in self.modifiers.items() if not state[2])
+        for mod in mods:
+            self.modifiers[mod][1] = True
+        stroke = [key, mods, timestamp, None, 0, False]
+        self.pending.append(stroke)
+        self.open[key] = stroke
+
+    def _key_up(self, key, timestamp):
+        if key in MODIFIERS:
+            state = self.modifiers.pop(key, None)
+            if state is None:
+                return
+            if state[2]:
+                self._release_all()
+                self._emit(('keyup', key, timestamp))
+            elif not state[1]:
+                # A modifier tapped on its own
+                self.pending.append([key, (), state[0], timestamp, 0, False])
+                self._release_closed()
+            return
+        stroke = self.open.pop(key, None)
+        if stroke is None:
+            return
+        if stroke[5]:
+            self._release_all()
+            self._emit(('keyup', key, timestamp))
+            return
+        stroke[3] = timestamp
+        self._release_closed()
+
+    def _pass_through_held(self, action):
+        """Turns keys held across a non-key action into raw keydown events"""
+        if not self.open and not self.modifiers:
+            if self.pending:
+                self._release_closed()
+            return
+        self._release_all()
+        for key, state in self.modifiers.items():
+            if not state[2]:
+                state[1] = state[2] = True
+                self._emit(('keydown', key, state[0]))
+
+    def _release_closed(self):
+        while self.pending and self.pending[0][3] is not None:
+            self._stroke(self.pending.popleft())
+
+    def _release_all(self):
+        while self.pending:
+            stroke = self.pending.popleft()
+            if stroke[3] is not None:
+                self._stroke(stroke)
+            else:
+                self._flush_runs()
+                stroke[5] = True
+                self._emit(('keydown', stroke[0], stroke[2]))
+
+    def _stroke(self, stroke):
+        key, mods, down, up, repeats, _ = stroke
+        if repeats >= self.repeat_threshold and not mods:
+            self._flush_runs()
+            self._emit(('hold', key, round(up - down, 3), repeats, down))
+            return
+        if mods:
+            if set(mods) <= SHIFT_KEYS and len(key) == 1 and key.isalpha():
+                self._add_char(key.upper(), down)
+            else:
+                self._flush_runs()
+                self._emit(('hotkey', mods + (key,), down))
+            return
+        if len(key) == 1:
+            self._add_char(key, down)
+        elif key in TEXT_KEYS:
+            self._add_char(TEXT_KEYS[key], down)
+        else:
+            self._add_tap(key, down)
+
+    def _add_char(self, char, timestamp):
+        if self.taps or (self.text and timestamp - self.text_times[-1] > self.max_gap):
+            self._flush_runs()
+        self.text.append(char)
+        self.text_times.append(timestamp)
+
+    def _add_tap(self, key, timestamp):
+        if self.text or (self.taps and (self.taps[-1][0] != key or timestamp - self.taps[-1][1] > self.max_gap)):
+            self._flush_runs()
+        self.taps.append((key, timestamp))
+
+    def _flush_runs(self):
+        if self.text:
+            text, times = ''.join(self.text), self.text_times
+            interval = (times[-1] - times[0]) / (len(times) - 1) if len(times) > 1 else 0.0
+            self.text = []
+            self.text_times = []
+            self._emit(('write', text, round(interval, 3), times[0]))
+        if self.taps:
+            taps = self.taps
+            interval = (taps[-1][1] - taps[0][1]) / (len(taps) - 1) if len(taps) > 1 else 0.0
+            self.taps = []
+            self._emit(('press', taps[0][0], len(taps), round(interval, 3), taps[0][1]))
+
+    def _emit(self, action):
+        if action[0] in ('write', 'press', 'hotkey', 'hold', 'keydown', 'keyup'):
+            self.calls_out += 1
+        self.output.append(action)
@@ -1,9 +1,18 @@
 import logging
 import time
+import threading
 import platform
 from pynput import keyboard
 import json
 
+# Handle both package and direct script usage
+try:
+    from .event_clock import EventClock, now_ns
+    from .tracing import tracer
+except ImportError:
+    from event_clock import EventClock, now_ns
+    from tracing import tracer
+
 class KeyboardRecorder:
     def __init__(self, recorder):
         # Base key mappings for all platforms
@@ -50,60 +59,56 @@ class KeyboardRecorder:
                 'Key.shift_r': 'shiftright',
             })
 
-        self.start_time = None
+        self.clock = None
         self.is_recording = False
         self.recorder = recorder
         self.listener = None
         logging.info("KeyboardRecorder initialized")
 
-    def start(self, start_time):
-        self.start_time = start_time
+    def start(self, clock):
+        self.clock = clock
         self.is_recording = True
         self.listener = keyboard.Listener(
             on_press=lambda key: self.on_keyboard_event(key, True),
             on_release=lambda key: self.on_keyboard_event(key, False)
         )
         self.listener.start()
-        logging.debug(f"Keyboard recording started at {start_time}")
+        logging.debug(f"Keyboard recording started at {clock.origin_ns} ns")
 
     def stop(self):
         self.is_recording = False
         if self.listener:
             self.listener.stop()
-        self.start_time = None
+            # A key still in the listener callback must be queued before the merger drains
+            if self.listener is not threading.current_thread():
+                self.listener.join()
+        self.clock = None
         logging.info("Keyboard recording stopped")
 
     def on_keyboard_event(self, key, is_press):
         """Handle keyboard events with pynput compatibility"""
-        logging.debug(f"Keyboard event: key={key}, is_press={is_press}")
+        dispatch_ns = now_ns()
+        if tracer.enabled:
+            tracer.emit('keyboard.event', key, is_press)
         if not self.is_recording:
             return
             
         try:
-            if self.start_time is None:
-                logging.warning("Keyboard event received but start_time is None")
-                return
-                
-            current_time = time.time()
-            if current_time < self.start_time:
-                logging.warning("Invalid timestamp detected")
+            clock = self.clock
+            if clock is None:
+                logging.warning("Keyboard event received but the clock is not running")
                 return
                 
             normalized_key = self._normalize_key(key)
-            logging.debug(f"Normalized key: {normalized_key}")
+            if tracer.enabled:
+                tracer.emit('keyboard.normalized', normalized_key)
             if not normalized_key:
                 return
                 
-            timestamp = current_time - self.start_time
+            timestamp = clock.elapsed(dispatch_ns)
             
-            event_data = {
-                'type': 'keydown' if is_press else 'keyup',
-                'key': normalized_key,
-                'timestamp': timestamp
-            }
-            logging.debug(f"Event data: {event_data}")
-            
-            self.recorder.handle_keyboard_event(event_data)
+            self.recorder.handle_keyboard_event('keydown' if is_press else 'keyup', normalized_key, timestamp,
+                                                dispatch_ns=dispatch_ns)
                 
         except Exception as e:
             logging.exception(f"Error processing keyboard event: {e}")
@@ -113,21 +118,24 @@ class KeyboardRecorder:
         try:
             if isinstance(key, keyboard.KeyCode):
                 # Handle normal character keys
-                if hasattr(key, 'char') and key.char:
-                    if key.char.isprintable():
-                        return key.char.lower()
-                    return ''
+                if hasattr(key, 'char') and key.char and key.char.isprintable():
+                    return key.char.lower()
+                # With ctrl held Windows delivers a control character ('\x01' for ctrl+a);
+                # the virtual key code of a letter or digit is its uppercase ASCII code
+                vk = getattr(key, 'vk', None)
+                if vk is not None and (0x30 <= vk <= 0x39 or 0x41 <= vk <= 0x5A):
+                    return chr(vk).lower()
                 return ''
 
             # Special key handling
             key_str = str(key)
             
-            # Remove 'Key.' prefix if present
+            # Get the normalized key, or the name without the 'Key.' prefix
+            if key_str in self.key_replacements:
+                return self.key_replacements[key_str]
             if key_str.startswith('Key.'):
-                key_str = key_str
-
-            # Get the normalized key or return the original
-            return self.key_replacements.get(key_str, key_str)
+                return key_str[4:]
+            return key_str
         except:
             logging.error(f"Error normalizing key: {key}", exc_info=True)
             return ''
@@ -137,7 +145,8 @@ class TestRecorder:
     def __init__(self):
         self.events = []
         
-    def handle_keyboard_event(self, event_data):
+    def handle_keyboard_event(self, event_type, key, timestamp, dispatch_ns=0):
+        event_data = {'type': event_type, 'key': key, 'timestamp': timestamp}
         print(f"Recorded event: {json.dumps(event_data)}")
         self.events.append(event_data)
 
@@ -148,7 +157,9 @@ if __name__ == "__main__":
     try:
         test_recorder = TestRecorder()
         recorder = KeyboardRecorder(test_recorder)
-        recorder.start(time.time())
+        clock = EventClock()
+        clock.start()
+        recorder.start(clock)
         
         # Keep the main thread alive
         while True:
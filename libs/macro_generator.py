@@ -1,152 +1,230 @@
+import json
+import shutil
 import logging
+from pathlib import Path
 import pyautogui
 
+# Handle both package and direct script usage
+try:
+    from .recording_format import RecordingReader, write_recording
+    from .tracing import tracer
+    from .key_coalescer import KeyCoalescer
+    from .gesture_recognizer import GestureRecognizer
+    from .action_optimizer import ActionOptimizer
+except ImportError:
+    from recording_format import RecordingReader, write_recording
+    from tracing import tracer
+    from key_coalescer import KeyCoalescer
+    from gesture_recognizer import GestureRecognizer
+    from action_optimizer import ActionOptimizer
+
+# Actions whose last item is a screenshot id and second to last the timestamp
+SCREENSHOT_ACTIONS = ('mouseDown', 'click', 'doubleClick', 'tripleClick', 'drag', 'longPress')
+
+def action_timestamp(action):
+    """Returns the recorded timestamp of an action tuple"""
+    if action[0] in SCREENSHOT_ACTIONS:
+        return action[-2]
+    return action[-1]
+
+def action_duration(action):
+    """Returns how long a coalesced keyboard or gesture action takes to play back"""
+    if action[0] in ('drag', 'longPress'):
+        return action[-3]
+    if action[0] == 'write':
+        return action[2] * (len(action[1]) - 1)
+    if action[0] == 'press':
+        return action[3] * (action[2] - 1)
+    if action[0] == 'hold':
+        return action[2]
+    return 0
+
 class MacroGenerator:
-    def __init__(self):
+    def __init__(self, timing=None):
         self.screen_width, self.screen_height = pyautogui.size()
+        # Default macro_runtime.TimingPolicy written into generated scripts; None plays as recorded
+        self.timing = timing
         # Add margin from the edge of the screen for safety
         self.safe_margin = 5
+        self.gesture_recognizer = GestureRecognizer()
+        self.key_coalescer = KeyCoalescer()
+        self.optimizer = ActionOptimizer()
+        self.segment_cache = {}  # (first row, end row) of a session -> (rendered rows, render stats)
+        self.cache_fingerprint = None
+        self.stats = (0, 0, 0)  # Render stats of the last generated macro
         logging.info("MacroGenerator initialized")
         
     def _adjust_coordinates(self, x, y):
         """Adjusts coordinates to avoid triggering PyAutoGUI's fail-safe"""
         safe_x = max(self.safe_margin, min(x, self.screen_width - self.safe_margin))
         safe_y = max(self.safe_margin, min(y, self.screen_height - self.safe_margin))
-        if safe_x != x or safe_y != y:
-            logging.debug(f"Coordinates adjusted: ({x}, {y}) -> ({safe_x}, {safe_y})")
+        if tracer.enabled and (safe_x != x or safe_y != y):
+            tracer.emit('generator.adjust', x, y, safe_x, safe_y)
         return safe_x, safe_y
     
-    def generate_code(self, actions):
-        """Generates macro code from a list of actions"""
+    def _action_op(self, action, delay):
+        """Converts an action into a runtime table entry: (op, delay, *arguments)"""
+        kind = action[0]
+        if kind == 'move':
+            _, x, y, _ = action
+            return ('move', delay, x, y)
+        if kind in ('mouseDown', 'click'):
+            _, x, y, button, _, screenshot_num = action
+            return (kind, delay, x, y, button, screenshot_num)
+        if kind == 'mouseUp':
+            _, x, y, button, _ = action
+            return ('mouseUp', delay, x, y, button)
+        if kind == 'scroll':
+            _, x, y, _, amount, _ = action
+            return ('scroll', delay, x, y, amount)
+        if kind in ('doubleClick', 'tripleClick'):
+            _, x, y, _, screenshot_num = action
+            return (kind, delay, x, y, screenshot_num)
+        if kind == 'drag':
+            _, x, y, button, path, duration, _, screenshot_num = action
+            return ('drag', delay, x, y, button, path, duration, screenshot_num)
+        if kind == 'longPress':
+            _, x, y, button, duration, _, screenshot_num = action
+            return ('longPress', delay, x, y, button, duration, screenshot_num)
+        if kind in ('write', 'hotkey', 'press', 'hold'):
+            return (kind, delay) + tuple(action[1:-1])
+        if kind == 'keydown':
+            return ('keyDown', delay, action[1])
+        if kind == 'keyup':
+            return ('keyUp', delay, action[1])
+        raise ValueError(f"Unknown action type {kind!r}")
+
+    def export_runtime(self, project_path):
+        """Copies the macro_runtime package next to a saved project's main.py"""
+        runtime_dir = Path(__file__).parent / 'macro_runtime'
+        shutil.copytree(runtime_dir, Path(project_path) / 'macro_runtime', dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns('__pycache__'))
+
+    def save_recording(self, path, actions, segments=(), original_size=None):
+        """Writes actions to a binary recording tagged with `original_size`, by default this screen's size"""
+        return write_recording(path, actions, tuple(original_size or (self.screen_width, self.screen_height)),
+                               segments)
+
+    def generate_code_from_recording(self, path):
+        """Generates macro code straight from a binary recording"""
+        with RecordingReader(path) as recording:
+            return self.generate_code(recording, original_size=recording.screen_size)
+
+    def clear_cache(self):
+        """Drops cached segment output; call when the recorded events are replaced"""
+        self.segment_cache = {}
+
+    def _settings_fingerprint(self, original_size):
+        """Everything besides the events that changes the generated rows"""
+        return (
+            tuple(original_size),
+            (self.screen_width, self.screen_height),
+            (self.gesture_recognizer.drag_slop, self.gesture_recognizer.long_press,
+             self.gesture_recognizer.straight_tolerance),
+            (self.key_coalescer.max_gap, self.key_coalescer.repeat_threshold),
+            self.optimizer.config(),
+        )
+
+    def _render_rows(self, actions):
+        """Renders actions as action table rows, one JSON array per line"""
+        rows = []
+        last_time = 0
+        gestures = self.gesture_recognizer.recognize(actions)
+        coalesced = self.key_coalescer.coalesce(gestures, action_timestamp)
+        optimized = self.optimizer.optimize(coalesced)
+        self.optimizer.log_stats()
+        for action in optimized:
+            if tracer.enabled:
+                tracer.emit('generator.action', action)
+            delay = max(0.0, round(action_timestamp(action) - last_time, 3))
+            # Quotes are escaped so a row can never end the raw string
+            rows.append(json.dumps(self._action_op(action, delay)).replace("'", "\\u0027"))
+            last_time = action_timestamp(action) + action_duration(action)
+        return "\n".join(rows)
+
+    def _render_stats(self):
+        """(key events, keyboard calls, mouse gestures) of the last _render_rows"""
+        return (self.key_coalescer.keys_in, self.key_coalescer.calls_out, self.gesture_recognizer.gestures)
+
+    def _render_segments(self, actions, segments, original_size):
+        """Renders each recording session separately, reusing cached sessions.
+
+        Timestamps restart with every session, so a session renders the same
+        way whatever comes before it and is cached by its row range. The
+        cache is dropped when the generator settings change.
+        """
+        fingerprint = self._settings_fingerprint(original_size)
+        if fingerprint != self.cache_fingerprint:
+            self.segment_cache = {}
+            self.cache_fingerprint = fingerprint
+        bounds = sorted(set(segments) | {0})
+        bounds = [start for start in bounds if start < len(actions)] + [len(actions)]
+        cache = {}
+        chunks = []
+        totals = [0, 0, 0]
+        for start, stop in zip(bounds, bounds[1:]):
+            entry = self.segment_cache.get((start, stop))
+            if entry is None:
+                chunk = self._render_rows(actions[start:stop])
+                entry = (chunk, self._render_stats())
+            cache[(start, stop)] = entry
+            chunk, stats = entry
+            if chunk:
+                chunks.append(chunk)
+            totals = [total + value for total, value in zip(totals, stats)]
+        self.stats = tuple(totals)
+        rendered = len(cache.keys() - self.segment_cache.keys())
+        logging.debug(f"Rendered {rendered} of {len(cache)} segments, reused the rest from the cache")
+        # Only the current ranges are kept, so a growing session does not pile up entries
+        self.segment_cache = cache
+        return "\n".join(chunks)
+
+    def generate_code(self, actions, original_size=None, segments=None):
+        """Generates macro code from a list of actions.
+
+        The script holds the actions as one JSON array per line inside a
+        single string literal, interpreted by macro_runtime, so compiling it
+        costs about the same however long the recording is. With `segments`
+        (the first row of each recording session) sessions are rendered
+        separately and cached between calls.
+        """
         logging.debug(f"Generating code for {len(actions)} actions")
+        original_size = tuple(original_size or (self.screen_width, self.screen_height))
+        if segments is None:
+            rows = self._render_rows(actions)
+            self.stats = self._render_stats()
+        else:
+            rows = self._render_segments(actions, segments, original_size)
         code = [
-            "import pyautogui",
-            "import time",
-            "from pathlib import Path",
-            "import logging",
-            "",
-            "# Set safe settings",
-            "pyautogui.FAILSAFE = True",
-            "pyautogui.PAUSE = 0.05",
+            "try:",
+            "    import macro_runtime",
+            "except ImportError:",
+            "    from libs import macro_runtime",
             "",
-            "def adjust_coordinates(x, y, screen_width, screen_height, margin=5):",
-            "    '''Adjusts coordinates to avoid triggering fail-safe'''",
-            "    safe_x = max(margin, min(x, screen_width - margin))",
-            "    safe_y = max(margin, min(y, screen_height - margin))",
-            "    return safe_x, safe_y",
+            f"ORIGINAL_SCREEN_SIZE = ({original_size[0]}, {original_size[1]})",
             "",
-            "def calculate_new_coordinates(original_x, original_y, original_width, original_height):",
-            "    current_width, current_height = pyautogui.size()",
-            "    new_x = int((original_x * current_width) / original_width)",
-            "    new_y = int((original_y * current_height) / original_height)",
-            "    return adjust_coordinates(new_x, new_y, current_width, current_height)",
+            "# [operation, seconds to wait before it, *arguments] - see macro_runtime",
+            "ACTIONS = macro_runtime.parse_actions(r'''",
+        ]
+        footer = [
+            "''')",
             "",
-            f"ORIGINAL_SCREEN_SIZE = ({self.screen_width}, {self.screen_height})",
+            "# Playback speed, e.g. macro_runtime.TimingPolicy(speed=2.0, max_gap=1.0), (turbo=True) or (wait_for_target=True)",
+            f"TIMING = {self.timing!r}",
             "",
             "def run_script():",
-            "    screens_dir = Path('screens')",
-            "    if not screens_dir.exists():",
-            "        logging.error('Directory screens not found')",
-            "        return",
-            "    ",
-            "    # Get current screen size",
-            "    current_width, current_height = pyautogui.size()",
-            "    logging.info(f'Screen size: {current_width}x{current_height}')",
-            ""
+            "    macro_runtime.run_actions(ACTIONS, ORIGINAL_SCREEN_SIZE, 'screens', TIMING)",
+            "",
+            "if __name__ == '__main__':",
+            "    run_script()",
         ]
+        if rows:
+            code.append(rows)
+        code.extend(footer)
         
-        if not actions:
-            code.append("    print('No recorded actions')")
-            code.append("    return")
-            code.append("")
-            return "\n".join(code)
-        
-        last_time = 0
-        for action in actions:
-            logging.debug(f"Processing action: {action}")
-            delay = action[-1] - last_time
-            if delay > 0.05:
-                code.append(f"    time.sleep({delay:.2f})")
-            
-            if action[0] == 'move':
-                _, x, y, _ = action
-                code.append(f"    # Move mouse to position ({x}, {y})")
-                code.append(f"    safe_x, safe_y = adjust_coordinates({x}, {y}, current_width, current_height)")
-                code.append(f"    pyautogui.moveTo(safe_x, safe_y, _pause=False)")
-            elif action[0] == 'mouseDown':
-                _, x, y, button, _, screenshot_num = action
-                if screenshot_num is not None:
-                    code.append(f"    # Find and click on image {screenshot_num}.png")
-                    code.append(f"    image_path = str(screens_dir / '{screenshot_num}.png')")
-                    code.append(f"    try:")
-                    code.append(f"        target = pyautogui.locateOnScreen(image_path, confidence=0.9)")
-                    code.append(f"        if target:")
-                    code.append(f"            target_center = pyautogui.center(target)")
-                    code.append(f"            safe_x, safe_y = adjust_coordinates(target_center.x, target_center.y, current_width, current_height)")
-                    code.append(f"            logging.info(f'Found image {screenshot_num}.png at position ({{safe_x}}, {{safe_y}})')")
-                    code.append(f"            pyautogui.click(safe_x, safe_y, button='{button}', _pause=False)")
-                    code.append(f"        else:")
-                    code.append(f"            raise pyautogui.ImageNotFoundException")
-                    code.append(f"    except pyautogui.ImageNotFoundException:")
-                    code.append(f"        logging.warning(f'Image {{image_path}} not found, using relative coordinates')")
-                    code.append(f"        new_x, new_y = calculate_new_coordinates({x}, {y}, *ORIGINAL_SCREEN_SIZE)")
-                    code.append(f"        pyautogui.click(new_x, new_y, button='{button}', _pause=False)")
-                else:
-                    code.append(f"    # Mouse click at position ({x}, {y})")
-                    code.append(f"    new_x, new_y = calculate_new_coordinates({x}, {y}, *ORIGINAL_SCREEN_SIZE)")
-                    code.append(f"    pyautogui.click(new_x, new_y, button='{button}', _pause=False)")
-            elif action[0] == 'mouseUp':
-                _, x, y, button, _ = action
-                code.append(f"    # Mouse button release at position ({x}, {y})")
-                code.append(f"    safe_x, safe_y = adjust_coordinates({x}, {y}, current_width, current_height)")
-                code.append(f"    pyautogui.mouseUp(safe_x, safe_y, button='{button}', _pause=False)")
-            elif action[0] == 'scroll':
-                _, x, y, _, delta, _ = action
-                code.append(f"    # Mouse scroll at position ({x}, {y})")
-                code.append(f"    safe_x, safe_y = adjust_coordinates({x}, {y}, current_width, current_height)")
-                code.append(f"    pyautogui.scroll({delta}, x=safe_x, y=safe_y)")
-            elif action[0] == 'keydown':
-                _, key, _ = action
-                code.append(f"    # Key press {key}")
-                if len(key) == 1:
-                    code.append(f"    pyautogui.press('{key}', _pause=False)")
-                else:
-                    code.append(f"    pyautogui.keyDown('{key}', _pause=False)")
-            elif action[0] == 'keyup':
-                _, key, _ = action
-                if len(key) > 1:
-                    code.append(f"    # Key release {key}")
-                    code.append(f"    pyautogui.keyUp('{key}', _pause=False)")
-            elif action[0] == 'doubleClick':
-                _, x, y, timestamp, screenshot_num = action
-                if screenshot_num is not None:
-                    code.append(f"    # Double click on image {screenshot_num}.png")
-                    code.append(f"    image_path = str(screens_dir / '{screenshot_num}.png')")
-                    code.append(f"    try:")
-                    code.append(f"        target = pyautogui.locateOnScreen(image_path, confidence=0.9)")
-                    code.append(f"        if target:")
-                    code.append(f"            target_center = pyautogui.center(target)")
-                    code.append(f"            safe_x, safe_y = adjust_coordinates(target_center.x, target_center.y, current_width, current_height)")
-                    code.append(f"            logging.info(f'Found image {screenshot_num}.png at position ({{safe_x}}, {{safe_y}})')")
-                    code.append(f"            pyautogui.doubleClick(safe_x, safe_y, _pause=False)")
-                    code.append(f"        else:")
-                    code.append(f"            raise pyautogui.ImageNotFoundException")
-                    code.append(f"    except pyautogui.ImageNotFoundException:")
-                    code.append(f"        logging.warning(f'Image {{image_path}} not found, using relative coordinates')")
-                    code.append(f"        new_x, new_y = calculate_new_coordinates({x}, {y}, *ORIGINAL_SCREEN_SIZE)")
-                    code.append(f"        pyautogui.doubleClick(new_x, new_y, _pause=False)")
-                else:
-                    code.append(f"    # Double click at position ({x}, {y})")
-                    code.append(f"    new_x, new_y = calculate_new_coordinates({x}, {y}, *ORIGINAL_SCREEN_SIZE)")
-                    code.append(f"    pyautogui.doubleClick(new_x, new_y, _pause=False)")
-            
-            last_time = action[-1]
-        
-        code.append("")
-        code.append("if __name__ == '__main__':")
-        code.append("    run_script()")
-        
-        logging.info("Code generation completed")
+        keys_in, calls_out, gestures = self.stats
+        logging.info(f"Code generation completed ({keys_in} key events "
+                     f"-> {calls_out} keyboard calls, {gestures} mouse gestures)")
         return "\n".join(code)
 
 if __name__ == '__main__':
@@ -0,0 +1,31 @@
+"""Playback runtime shared by all generated macros.
+
+Generated scripts hold only a table of actions and call `run_actions`;
+locating templates, scaling coordinates and driving the input backend
+(pyautogui, or a SimulatedBackend for runs without a display) live here.
+Saved projects get a copy of this package next to their main.py.
+"""
+from .interpreter import Playback, PlaybackStopped, parse_actions, run_actions, set_observer, HANDLERS
+from .backends import PyAutoGUIBackend, SimulatedBackend, get_backend, set_backend
+from .frames import FrameCache
+from .targets import adjust_coordinates, calculate_new_coordinates, locate_target
+from .timing import TimingPolicy, AS_RECORDED
+
+__all__ = [
+    'Playback',
+    'PlaybackStopped',
+    'parse_actions',
+    'run_actions',
+    'set_observer',
+    'HANDLERS',
+    'adjust_coordinates',
+    'calculate_new_coordinates',
+    'locate_target',
+    'FrameCache',
+    'PyAutoGUIBackend',
+    'SimulatedBackend',
+    'get_backend',
+    'set_backend',
+    'TimingPolicy',
+    'AS_RECORDED',
+]
@@ -0,0 +1,183 @@
+import time
+import threading
+
+from PIL import Image
+
+class PyAutoGUIBackend:
+    """Real screen, real input through pyautogui and the wall clock"""
+    realtime = True
+
+    def __init__(self):
+        import pyautogui  # Imported on first use so simulations run without a display
+        self.pyautogui = pyautogui
+
+    def configure(self, pause):
+        self.pyautogui.FAILSAFE = True
+        self.pyautogui.PAUSE = pause
+
+    def size(self):
+        return tuple(self.pyautogui.size())
+
+    def screenshot(self):
+        return self.pyautogui.screenshot()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def move_to(self, x, y, duration=0):
+        self.pyautogui.moveTo(x, y, duration=duration, _pause=False)
+
+    def mouse_down(self, x, y, button):
+        self.pyautogui.mouseDown(x, y, button=button, _pause=False)
+
+    def mouse_up(self, x, y, button):
+        self.pyautogui.mouseUp(x, y, button=button, _pause=False)
+
+    def click(self, x, y, button='left', clicks=1):
+        # doubleClick/tripleClick send a native multi-click on macOS
+        if clicks == 2:
+            self.pyautogui.doubleClick(x, y, button=button, _pause=False)
+        elif clicks == 3:
+            self.pyautogui.tripleClick(x, y, button=button, _pause=False)
+        else:
+            self.pyautogui.click(x, y, clicks=clicks, button=button, _pause=False)
+
+    def drag_to(self, x, y, duration, button):
+        self.pyautogui.dragTo(x, y, duration=duration, button=button, _pause=False)
+
+    def scroll(self, amount, x, y):
+        self.pyautogui.scroll(amount, x=x, y=y)
+
+    def write(self, text, interval):
+        self.pyautogui.write(text, interval=interval, _pause=False)
+
+    def hotkey(self, keys):
+        self.pyautogui.hotkey(*keys, _pause=False)
+
+    def press(self, key, presses, interval):
+        self.pyautogui.press(key, presses=presses, interval=interval, _pause=False)
+
+    def key_down(self, key):
+        self.pyautogui.keyDown(key, _pause=False)
+
+    def key_up(self, key):
+        self.pyautogui.keyUp(key, _pause=False)
+
+class SimulatedBackend:
+    """In-memory screen, recorded input and a virtual clock.
+
+    The framebuffer starts as `screen` (an image or a path) and changes only
+    through `show`, which pastes an image at a given virtual time. Input is
+    appended to `calls` as (virtual time, name, args) and sleeps only move
+    the clock, so a macro plays in the time its template searches take.
+    Time spent by pyautogui itself (typing and drag intervals, PAUSE after a
+    scroll) is added to the clock the same way.
+    """
+    realtime = False
+
+    def __init__(self, screen, size=None):
+        image = Image.open(screen) if not isinstance(screen, Image.Image) else screen
+        image = image.convert('RGB')
+        if size and tuple(size) != image.size:
+            image = image.resize(tuple(size))
+        self.framebuffer = image
+        self.now = 0.0
+        self.pause = 0.0
+        self.position = (0, 0)
+        self.calls = []
+        self.scheduled = []  # (virtual time, image, (left, top)) not yet shown
+        self.grabs = 0
+        self.lock = threading.Lock()
+
+    def show(self, image, at=None, position=(0, 0)):
+        """Pastes an image (or path) into the framebuffer at virtual time `at`, or now"""
+        image = Image.open(image) if not isinstance(image, Image.Image) else image
+        with self.lock:
+            self.scheduled.append((self.now if at is None else at, image.convert('RGB'), tuple(position)))
+            self.scheduled.sort(key=lambda update: update[0])
+
+    def configure(self, pause):
+        self.pause = pause
+
+    def size(self):
+        return self.framebuffer.size
+
+    def screenshot(self):
+        with self.lock:
+            while self.scheduled and self.scheduled[0][0] <= self.now:
+                _, image, position = self.scheduled.pop(0)
+                self.framebuffer = self.framebuffer.copy()
+                self.framebuffer.paste(image, position)
+            self.grabs += 1
+            return self.framebuffer
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.now += max(0.0, seconds)
+
+    def monotonic(self):
+        return self.now
+
+    def _record(self, name, *args, elapsed=0.0):
+        with self.lock:
+            self.calls.append((self.now, name, args))
+            self.now += elapsed
+
+    def move_to(self, x, y, duration=0):
+        self._record('move_to', x, y, elapsed=duration)
+        self.position = (x, y)
+
+    def mouse_down(self, x, y, button):
+        self._record('mouse_down', x, y, button)
+        if x is not None:
+            self.position = (x, y)
+
+    def mouse_up(self, x, y, button):
+        self._record('mouse_up', x, y, button)
+        if x is not None:
+            self.position = (x, y)
+
+    def click(self, x, y, button='left', clicks=1):
+        self._record('click', x, y, button, clicks)
+        self.position = (x, y)
+
+    def drag_to(self, x, y, duration, button):
+        self._record('drag_to', x, y, button, elapsed=duration)
+        self.position = (x, y)
+
+    def scroll(self, amount, x, y):
+        self._record('scroll', amount, x, y, elapsed=self.pause)
+        self.position = (x, y)
+
+    def write(self, text, interval):
+        self._record('write', text, elapsed=interval * len(text))
+
+    def hotkey(self, keys):
+        self._record('hotkey', *keys)
+
+    def press(self, key, presses, interval):
+        self._record('press', key, presses, elapsed=interval * presses)
+
+    def key_down(self, key):
+        self._record('key_down', key)
+
+    def key_up(self, key):
+        self._record('key_up', key)
+
+_backend = None
+
+def get_backend():
+    """The backend playbacks use when none is given; pyautogui unless set_backend changed it"""
+    global _backend
+    if _backend is None:
+        _backend = PyAutoGUIBackend()
+    return _backend
+
+def set_backend(backend):
+    """Makes every following playback use `backend`, None meaning pyautogui; returns the one replaced"""
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
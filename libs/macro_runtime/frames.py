@@ -0,0 +1,77 @@
+import hashlib
+import threading
+
+from .backends import get_backend
+
+class FrameCache:
+    """Template matches shared by consecutive searches during playback.
+
+    Every search grabs the screen anew, since any action may have changed
+    it. Each grab is reduced by `downsample`, split into `block`-pixel
+    squares and hashed, so the blocks that changed since the previous grab
+    are known. A match
+    remembered with `remember` stays valid until one of the blocks under
+    it changes, and can then be returned without searching again. The cache
+    may be shared with a prefetch thread.
+    """
+    def __init__(self, block=64, downsample=4, backend=None):
+        self.backend = backend or get_backend()
+        self.downsample = downsample
+        self.block = max(1, block // downsample) * downsample  # Whole pixels of the reduced frame
+        self.frame = None
+        self.hashes = None
+        self.matches = {}  # key -> box found in a still unchanged part of the screen
+        self.grabs = 0
+        self.lock = threading.Lock()
+
+    def grab(self):
+        """Takes a screenshot and forgets the matches on the parts of the screen that changed"""
+        with self.lock:
+            return self._grab()
+
+    def _grab(self):
+        frame = self.backend.screenshot()
+        hashes = self._block_hashes(frame)
+        if self.frame is None or frame.size != self.frame.size:
+            self.matches.clear()
+        elif self.matches:
+            dirty = {index for index, digest in enumerate(hashes) if digest != self.hashes[index]}
+            if dirty:
+                self.matches = {key: box for key, box in self.matches.items()
+                                if not dirty.intersection(self._blocks_under(box, frame.size[0]))}
+        self.frame = frame
+        self.hashes = hashes
+        self.grabs += 1
+        return frame
+
+    def match(self, key):
+        """Returns the box remembered for `key` if the screen under it has not changed"""
+        with self.lock:
+            return self.matches.get(key)
+
+    def remember(self, key, box):
+        with self.lock:
+            self.matches[key] = box
+
+    def _columns(self, width):
+        return -(-width // self.block)
+
+    def _block_hashes(self, frame):
+        small = frame.convert('L').reduce(self.downsample)
+        width, height = small.size
+        data = small.tobytes()
+        step = self.block // self.downsample
+        hashes = []
+        for top in range(0, height, step):
+            rows = [data[row * width:(row + 1) * width] for row in range(top, min(top + step, height))]
+            for left in range(0, width, step):
+                tile = b''.join(row[left:left + step] for row in rows)
+                hashes.append(hashlib.blake2b(tile, digest_size=8).digest())
+        return hashes
+
+    def _blocks_under(self, box, frame_width):
+        left, top, width, height = box
+        columns = self._columns(frame_width)
+        return {row * columns + column
+                for row in range(top // self.block, (top + height - 1) // self.block + 1)
+                for column in range(left // self.block, (left + width - 1) // self.block + 1)}
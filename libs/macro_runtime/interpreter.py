@@ -0,0 +1,236 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .backends import get_backend
+from .frames import FrameCache
+from .targets import adjust_coordinates, calculate_new_coordinates, find_on_screen, locate_target
+from .timing import AS_RECORDED
+
+# Ops whose last argument is the screenshot of the element they act on
+TARGET_OPS = frozenset(('click', 'mouseDown', 'doubleClick', 'tripleClick', 'drag', 'longPress'))
+
+_observer = None
+
+class PlaybackStopped(Exception):
+    """Raised by an observer to end a playback before its last action"""
+
+def set_observer(observer):
+    """Installs observer(index, total, op), called before every action of every playback; None removes it.
+
+    Players embedding the runtime use it to report progress, and stop a
+    macro by raising PlaybackStopped from it.
+    """
+    global _observer
+    _observer = observer
+
+class Playback:
+    """Interprets one macro action table.
+
+    Every action is a sequence [op, delay, *args] where `delay` is the
+    recorded gap in seconds before the action and `op` names a handler.
+    The timing policy decides how long those gaps are actually slept.
+
+    With `prefetch` the template of a targeted action is searched on a
+    worker thread while its gap is slept. The result goes through the frame
+    cache, so it is only used if the screen under the match did not change
+    by the time the action runs; otherwise the search is repeated.
+
+    A policy with `wait_for_target` skips the gaps of targeted actions and
+    of the moves leading up to them, and polls for the template instead, up
+    to a timeout derived from those gaps.
+    """
+    def __init__(self, original_size, screens_dir='screens', timing=None, prefetch=None, backend=None):
+        self.backend = backend or get_backend()
+        self.original_size = tuple(original_size)
+        self.screens_dir = Path(screens_dir)
+        self.screen_size = self.backend.size()
+        self.timing = timing or AS_RECORDED
+        self.frames = FrameCache(backend=self.backend)
+        # Searching ahead only pays off against real waits
+        self.prefetch = self.backend.realtime if prefetch is None else prefetch
+        self.pending = None  # Future of the search started for the current action
+        self.deadline = None  # Until when the current action may poll for its target
+
+    def target(self, x, y, screenshot_num):
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+        deadline, self.deadline = self.deadline, None
+        return locate_target(self.screens_dir, screenshot_num, x, y, self.original_size, self.screen_size,
+                             self.frames, deadline, self.timing.poll, self.timing.max_poll)
+
+    def safe(self, x, y):
+        return adjust_coordinates(x, y, *self.screen_size)
+
+    def _locate_ahead(self, x, y, screenshot_num):
+        """Searches a template ahead of time; a found box is left in the frame cache"""
+        try:
+            find_on_screen(self.screens_dir, screenshot_num, calculate_new_coordinates(x, y, *self.original_size, self.screen_size),
+                           self.original_size, self.screen_size, self.frames)
+        except Exception as e:
+            logging.debug(f'Prefetch of image {screenshot_num}.png failed: {e}')
+
+    @staticmethod
+    def _polled(actions):
+        """Flags targeted actions and the moves right before them"""
+        flags = [False] * len(actions)
+        ahead = False
+        for index in range(len(actions) - 1, -1, -1):
+            action = actions[index]
+            if action[0] in TARGET_OPS and action[-1] is not None:
+                ahead = True
+            elif action[0] != 'move':
+                ahead = False
+            flags[index] = ahead
+        return flags
+
+    def run(self, actions):
+        handlers = HANDLERS
+        timing = self.timing
+        last = len(actions) - 1
+        polled = self._polled(actions) if timing.wait_for_target else None
+        waited = 0.0  # Recorded gaps skipped while heading for the next target
+        observer = _observer
+        total = len(actions)
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='macro-prefetch') if self.prefetch else None
+        try:
+            for index, action in enumerate(actions):
+                # Turbo keeps only the last of consecutive moves
+                if timing.turbo and action[0] == 'move' and index < last and actions[index + 1][0] == 'move':
+                    continue
+                if observer:
+                    observer(index, total, action[0])
+                targeted = action[0] in TARGET_OPS and action[-1] is not None
+                if polled and polled[index]:
+                    waited += action[1]
+                    if targeted:
+                        self.deadline = self.backend.monotonic() + timing.timeout(waited)
+                        waited = 0.0
+                    handlers[action[0]](self, *action[2:])
+                    continue
+                delay = timing.delay(action[1])
+                if delay > 0:
+                    if executor and targeted:
+                        self.pending = executor.submit(self._locate_ahead, action[2], action[3], action[-1])
+                    self.backend.sleep(delay)
+                handlers[action[0]](self, *action[2:])
+                self.pending = None
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+
+    # Mouse
+
+    def move(self, x, y):
+        self.backend.move_to(*self.safe(x, y))
+
+    def click(self, x, y, button, screenshot_num):
+        self.backend.click(*self.target(x, y, screenshot_num), button)
+
+    def mouse_down(self, x, y, button, screenshot_num):
+        self.backend.mouse_down(*self.target(x, y, screenshot_num), button)
+
+    def mouse_up(self, x, y, button):
+        self.backend.mouse_up(*self.safe(x, y), button)
+
+    def scroll(self, x, y, amount):
+        self.backend.scroll(amount, *self.safe(x, y))
+
+    def double_click(self, x, y, screenshot_num):
+        self.backend.click(*self.target(x, y, screenshot_num), clicks=2)
+
+    def triple_click(self, x, y, screenshot_num):
+        self.backend.click(*self.target(x, y, screenshot_num), clicks=3)
+
+    def drag(self, x, y, button, path, duration, screenshot_num):
+        backend = self.backend
+        target_x, target_y = self.target(x, y, screenshot_num)
+        backend.move_to(target_x, target_y)
+        if len(path) == 1:
+            dx, dy, _ = path[0]
+            backend.drag_to(target_x + dx, target_y + dy, self.timing.interval(duration), button)
+            return
+        backend.mouse_down(target_x, target_y, button)
+        for dx, dy, step in path:
+            backend.move_to(target_x + dx, target_y + dy, duration=self.timing.interval(step))
+        backend.mouse_up(None, None, button)
+
+    def long_press(self, x, y, button, duration, screenshot_num):
+        target_x, target_y = self.target(x, y, screenshot_num)
+        self.backend.mouse_down(target_x, target_y, button)
+        self.backend.sleep(duration)
+        self.backend.mouse_up(target_x, target_y, button)
+
+    # Keyboard
+
+    def write(self, text, interval):
+        self.backend.write(text, self.timing.interval(interval))
+
+    def hotkey(self, keys):
+        self.backend.hotkey(keys)
+
+    def press(self, key, presses, interval):
+        self.backend.press(key, presses, self.timing.interval(interval))
+
+    def hold(self, key, duration, repeats=0):
+        # Injected input is not auto-repeated by every OS, so recorded repeats are sent as keyDowns
+        step = duration / (repeats + 1)
+        self.backend.key_down(key)
+        for _ in range(repeats):
+            self.backend.sleep(step)
+            self.backend.key_down(key)
+        self.backend.sleep(step)
+        self.backend.key_up(key)
+
+    def key_down(self, key):
+        self.backend.key_down(key)
+
+    def key_up(self, key):
+        self.backend.key_up(key)
+
+HANDLERS = {
+    'move': Playback.move,
+    'click': Playback.click,
+    'mouseDown': Playback.mouse_down,
+    'mouseUp': Playback.mouse_up,
+    'scroll': Playback.scroll,
+    'doubleClick': Playback.double_click,
+    'tripleClick': Playback.triple_click,
+    'drag': Playback.drag,
+    'longPress': Playback.long_press,
+    'write': Playback.write,
+    'hotkey': Playback.hotkey,
+    'press': Playback.press,
+    'hold': Playback.hold,
+    'keyDown': Playback.key_down,
+    'keyUp': Playback.key_up,
+}
+
+def parse_actions(text):
+    """Reads an action table written as one JSON array per line; '#' lines are comments"""
+    rows = [line for line in text.splitlines() if line.strip() and not line.lstrip().startswith('#')]
+    return json.loads('[' + ','.join(rows) + ']')
+
+def run_actions(actions, original_size, screens_dir='screens', timing=None, backend=None):
+    """Plays an action table recorded on a screen of `original_size` under a TimingPolicy.
+
+    `backend` defaults to the one installed with set_backend, normally pyautogui.
+    """
+    timing = timing or AS_RECORDED
+    backend = backend or get_backend()
+    # Set safe settings
+    backend.configure(min(0.05, timing.settle) if timing.turbo else 0.05)
+
+    screens_dir = Path(screens_dir)
+    if not screens_dir.exists():
+        logging.error(f'Directory {screens_dir} not found')
+        return
+    if not actions:
+        print('No recorded actions')
+        return
+
+    playback = Playback(original_size, screens_dir, timing, backend=backend)
+    logging.info(f'Screen size: {playback.screen_size[0]}x{playback.screen_size[1]}')
+    playback.run(actions)
@@ -0,0 +1,73 @@
+import cv2
+import numpy
+
+# Template scales tried, relative to the ratio between the playback and recording screens
+SCALE_SPREAD = (1.0, 0.9, 1.1, 0.8, 1.25)
+# Coarse level matching stops shrinking before the template gets smaller than this
+MIN_COARSE_SIZE = 12
+MAX_LEVELS = 3
+
+def screen_scale(original_size, screen_size):
+    """How much larger things are drawn on this screen than on the recording one"""
+    return (screen_size[0] / original_size[0] + screen_size[1] / original_size[1]) / 2
+
+def _gray(image):
+    return cv2.cvtColor(numpy.asarray(image.convert('RGB')), cv2.COLOR_RGB2GRAY)
+
+def _best(haystack, needle):
+    result = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+    _, score, _, location = cv2.minMaxLoc(numpy.nan_to_num(result, nan=-1.0))
+    return score, location
+
+def locate_scaled(template, haystack, scale, confidence=0.9, keep=2):
+    """Finds a template drawn `scale` times larger (or smaller) in a haystack image.
+
+    Scales around `scale` are first compared on a downsampled pyramid level
+    of the haystack; only the `keep` best of them are matched again at full
+    resolution, in a small window around their coarse position. Scale 1.0
+    is always among the candidates for applications that do not follow the
+    display scaling. Returns a (left, top, width, height) box in haystack
+    pixels, or None.
+    """
+    scales = [scale * factor for factor in SCALE_SPREAD]
+    if all(abs(candidate_scale - 1.0) > 0.05 for candidate_scale in scales):
+        scales.append(1.0)
+
+    full = _gray(haystack)
+    needle = _gray(template)
+    level = 0
+    smallest = min(needle.shape) * min(scales)
+    while level < MAX_LEVELS and smallest / 2 ** (level + 1) >= MIN_COARSE_SIZE:
+        level += 1
+    factor = 2 ** level
+    coarse = full
+    for _ in range(level):
+        coarse = cv2.pyrDown(coarse)
+
+    candidates = []
+    for candidate_scale in scales:
+        width = round(needle.shape[1] * candidate_scale)
+        height = round(needle.shape[0] * candidate_scale)
+        if not (4 <= width <= full.shape[1] and 4 <= height <= full.shape[0]):
+            continue
+        scaled = cv2.resize(needle, (width, height),
+                            interpolation=cv2.INTER_AREA if candidate_scale < 1 else cv2.INTER_LINEAR)
+        small = cv2.resize(scaled, (max(1, width // factor), max(1, height // factor)),
+                           interpolation=cv2.INTER_AREA)
+        if small.shape[0] > coarse.shape[0] or small.shape[1] > coarse.shape[1]:
+            continue
+        score, (x, y) = _best(coarse, small)
+        candidates.append((score, x * factor, y * factor, scaled))
+
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    for _, x, y, scaled in candidates[:keep]:
+        height, width = scaled.shape
+        margin = 2 * factor
+        left, top = max(0, x - margin), max(0, y - margin)
+        window = full[top:min(full.shape[0], y + height + margin), left:min(full.shape[1], x + width + margin)]
+        if window.shape[0] < height or window.shape[1] < width:
+            continue
+        score, (dx, dy) = _best(window, scaled)
+        if score >= confidence:
+            return (left + dx, top + dy, width, height)
+    return None
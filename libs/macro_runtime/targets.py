@@ -0,0 +1,130 @@
+import os
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+import pyscreeze
+from PIL import Image
+
+from .backends import get_backend
+
+from .frames import FrameCache
+from .matching import locate_scaled, screen_scale
+
+# Search windows around the expected position, as multiples of the template size,
+# tried in order before falling back to the whole screen
+SEARCH_STEPS = (2, 4)
+# Screens whose size ratio to the recording one is this close to 1 are matched unscaled
+SCALE_TOLERANCE = 0.02
+
+def adjust_coordinates(x, y, screen_width, screen_height, margin=5):
+    """Adjusts coordinates to avoid triggering fail-safe"""
+    safe_x = max(margin, min(x, screen_width - margin))
+    safe_y = max(margin, min(y, screen_height - margin))
+    return safe_x, safe_y
+
+def calculate_new_coordinates(original_x, original_y, original_width, original_height, screen_size=None):
+    """Scales a recorded position to the current screen size"""
+    current_width, current_height = screen_size or get_backend().size()
+    new_x = int((original_x * current_width) / original_width)
+    new_y = int((original_y * current_height) / original_height)
+    return adjust_coordinates(new_x, new_y, current_width, current_height)
+
+@lru_cache(maxsize=256)
+def _load_template(path, mtime_ns):
+    with Image.open(path) as image:
+        image.load()
+        return image.copy()
+
+def load_template(image_path):
+    """Decodes a template once per file version; edited screenshots are read again"""
+    return _load_template(image_path, os.stat(image_path).st_mtime_ns)
+
+def search_regions(center, template_size, screen_size, steps=SEARCH_STEPS):
+    """Yields (left, top, width, height) windows centred on `center`, growing
+    by `steps`, and finally None for the whole screen"""
+    screen_width, screen_height = screen_size
+    for step in steps:
+        width = min(template_size[0] * step, screen_width)
+        height = min(template_size[1] * step, screen_height)
+        if width >= screen_width and height >= screen_height:
+            break
+        left = min(max(int(center[0] - width / 2), 0), screen_width - width)
+        top = min(max(int(center[1] - height / 2), 0), screen_height - height)
+        yield (left, top, width, height)
+    yield None
+
+def find_template(template, center, frame, confidence=0.9, scale=1.0):
+    """Searches a screenshot for a template near `center`, widening to the whole frame; returns a box or None.
+
+    `scale` is how much larger the screen draws things than when the
+    template was recorded.
+    """
+    scaled = abs(scale - 1.0) > SCALE_TOLERANCE
+    size = (round(template.width * scale), round(template.height * scale)) if scaled else template.size
+    for region in search_regions(center, size, frame.size):
+        haystack = frame if region is None else frame.crop(
+            (region[0], region[1], region[0] + region[2], region[1] + region[3]))
+        if scaled:
+            box = locate_scaled(template, haystack, scale, confidence)
+        else:
+            try:
+                box = pyscreeze.locate(template, haystack, confidence=confidence)
+            except pyscreeze.ImageNotFoundException:
+                box = None
+        if box:
+            if region is None:
+                return tuple(box)
+            return (box[0] + region[0], box[1] + region[1], box[2], box[3])
+    return None
+
+def find_on_screen(screens_dir, screenshot_num, expected, original_size, screen_size, frames):
+    """Box of a recorded template searched around `expected`, or None; raises OSError for unreadable templates"""
+    image_path = str(Path(screens_dir) / f'{screenshot_num}.png')
+    key = (image_path, expected)
+    frame = frames.grab()
+    box = frames.match(key)
+    if box is None:
+        box = find_template(load_template(image_path), expected, frame,
+                            scale=screen_scale(original_size, screen_size))
+        if box is not None:
+            frames.remember(key, box)
+    return box
+
+def locate_target(screens_dir, screenshot_num, x, y, original_size, screen_size, frames=None,
+                  deadline=None, poll=0.05, max_poll=0.5):
+    """Returns where to act on a recorded position.
+
+    The centre of the click template is used when it is found on screen,
+    searching outward from the recorded position scaled to this screen;
+    otherwise that scaled position itself. With a FrameCache earlier matches
+    on a still unchanged part of the screen are reused. With a `deadline`
+    (a monotonic() value of the backend) fresh screenshots are searched until the
+    template appears, pausing `poll` seconds at first and backing off up to
+    `max_poll`, on the frame cache's backend clock.
+    """
+    expected = calculate_new_coordinates(x, y, *original_size, screen_size)
+    if screenshot_num is None:
+        return expected
+    image_path = Path(screens_dir) / f'{screenshot_num}.png'
+    frames = frames or FrameCache()
+    clock = frames.backend
+    try:
+        box = find_on_screen(screens_dir, screenshot_num, expected, original_size, screen_size, frames)
+        while box is None and deadline is not None:
+            remaining = deadline - clock.monotonic()
+            if remaining <= 0:
+                break
+            clock.sleep(min(poll, remaining))
+            poll = min(poll * 1.5, max_poll)
+            box = find_on_screen(screens_dir, screenshot_num, expected, original_size, screen_size, frames)
+    except OSError as e:
+        logging.warning(f'Image {image_path} could not be read ({e}), using relative coordinates')
+        return expected
+    if box is None:
+        logging.warning(f'Image {image_path} not found, using relative coordinates')
+        return expected
+    target_center = pyscreeze.center(box)
+    safe_x, safe_y = adjust_coordinates(target_center.x, target_center.y, *screen_size)
+    logging.info(f'Found image {screenshot_num}.png at position ({safe_x}, {safe_y})')
+    return safe_x, safe_y
@@ -0,0 +1,67 @@
+class TimingPolicy:
+    """How recorded waits are turned into sleeps at playback.
+
+    speed          divides every wait and every typing/drag interval
+    gap_threshold  waits longer than this are compressed by `gap_scale`
+    gap_scale      factor applied to the part of a wait above the threshold
+    max_gap        hard cap on any single wait
+    turbo          skips intermediate moves, types and drags without
+                   intervals and waits at most `settle` between actions
+    min_sleep      shorter waits are skipped entirely
+    wait_for_target
+                   actions on a recorded screenshot do not sleep their wait;
+                   the template is polled for and the action fires as soon
+                   as it shows up, giving up after `timeout(wait)`
+    wait_scale     the recorded wait times this is how long to poll ...
+    min_wait       ... but never less than this many seconds
+    poll, max_poll first pause between polls and the cap it backs off to
+
+    Hold and long-press durations are kept as recorded in every mode since
+    the target application reacts to how long the input was held.
+    """
+    def __init__(self, speed=1.0, gap_threshold=None, gap_scale=1.0, max_gap=None,
+                 turbo=False, settle=0.05, min_sleep=0.05, wait_for_target=False, wait_scale=2.0,
+                 min_wait=1.0, poll=0.05, max_poll=0.5):
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+        self.speed = speed
+        self.gap_threshold = gap_threshold
+        self.gap_scale = gap_scale
+        self.max_gap = max_gap
+        self.turbo = turbo
+        self.settle = settle
+        self.min_sleep = min_sleep
+        self.wait_for_target = wait_for_target
+        self.wait_scale = wait_scale
+        self.min_wait = min_wait
+        self.poll = poll
+        self.max_poll = max_poll
+
+    def __repr__(self):
+        defaults = TimingPolicy()
+        changed = [f"{name}={value!r}" for name, value in vars(self).items()
+                   if value != getattr(defaults, name)]
+        return f"macro_runtime.TimingPolicy({', '.join(changed)})"
+
+    def delay(self, delay):
+        """Seconds to sleep for a recorded wait"""
+        if self.turbo:
+            return min(delay, self.settle)
+        if self.gap_threshold is not None and delay > self.gap_threshold:
+            delay = self.gap_threshold + (delay - self.gap_threshold) * self.gap_scale
+        if self.max_gap is not None:
+            delay = min(delay, self.max_gap)
+        delay /= self.speed
+        return delay if delay > self.min_sleep else 0
+
+    def timeout(self, delay):
+        """Seconds to poll for a target recorded `delay` seconds after the previous action"""
+        return max(self.min_wait, delay * self.wait_scale)
+
+    def interval(self, interval):
+        """Seconds between typed keys or drag waypoints"""
+        if self.turbo:
+            return 0
+        return interval / self.speed
+
+AS_RECORDED = TimingPolicy()
@@ -1,55 +1,135 @@
 import time
+import threading
 import pyautogui
 import logging
 from pynput import mouse
 from pathlib import Path
 
+# Handle both package and direct script usage
+try:
+    from .screenshot_pool import ScreenshotPool
+    from .frame_buffer import FrameRingBuffer
+    from .event_clock import EventClock, now_ns
+    from .path_simplifier import PathSimplifier
+    from .gesture_recognizer import MULTI_CLICK_INTERVAL, MULTI_CLICK_DISTANCE, DRAG_SLOP, LONG_PRESS
+    from .tracing import tracer
+except ImportError:
+    from screenshot_pool import ScreenshotPool
+    from frame_buffer import FrameRingBuffer
+    from event_clock import EventClock, now_ns
+    from path_simplifier import PathSimplifier
+    from gesture_recognizer import MULTI_CLICK_INTERVAL, MULTI_CLICK_DISTANCE, DRAG_SLOP, LONG_PRESS
+    from tracing import tracer
+
 class MouseRecorder:
-    def __init__(self, screens_dir, recorder):
+    def __init__(self, screens_dir, recorder, pre_click_frames=False):
         self.screens_dir = screens_dir
         self.screenshot_counter = 0
         self.is_recording = False
         self.is_dragging = False
-        self.start_time = None
-        self.last_timestamp = 0
+        self.clock = None
         self.last_recorded_pos = (0, 0)
         self.last_mouse_position = (0, 0)
         self.mouse_move_threshold = 2
         self.position_check_interval = 0.016
-        self.min_event_interval = 0.016
+        # Keeps only the move points needed to stay within `tolerance` pixels of the real path
+        self.path_simplifier = PathSimplifier(tolerance=2.0)
+        self.path_lock = threading.Lock()  # The keyboard thread flushes the simplifier too
         self.mouse_listener = None
+        self.screen_size = None
+        self.screenshot_pool = ScreenshotPool(screens_dir)
+        # Optional ring of full frames so templates show the UI before the click
+        self.frame_buffer = FrameRingBuffer() if pre_click_frames else None
         
-        # Parameters for double-click detection
-        self.last_down_sequence = []
+        # Parameters for double-click detection; follow-up clicks reuse the first screenshot
+        self.last_down_sequence = []  # (timestamp, x, y) of the presses of the current multi-click
         self.last_up_sequence = []
-        self.double_click_threshold = 0.2
+        self.left_press = None  # (timestamp, x, y) of the left press not yet released
+        self.double_click_threshold = MULTI_CLICK_INTERVAL
         
         self.recorder = recorder  # Store reference to main recorder
         logging.info("MouseRecorder initialized")
         
-    def start(self, start_time):
-        self.start_time = start_time
+    def start(self, clock):
+        self.clock = clock
         self.is_recording = True
-        self.last_timestamp = start_time
+        self.path_simplifier.reset()
+        self.last_down_sequence = []
+        self.left_press = None
+        # Cache screen size so the click callback never queries it
+        self.screen_size = pyautogui.size()
+        self.screenshot_pool.screen_size = self.screen_size
+        self.screenshot_pool.start()
+        if self.frame_buffer:
+            self.frame_buffer.start()
         
         # Start mouse listener
         self.mouse_listener = mouse.Listener(
             on_move=self.on_mouse_event,
             on_click=self.on_mouse_event,
-            on_scroll=self.on_mouse_event
+            on_scroll=lambda x, y, dx, dy: self.on_mouse_event(x, y, delta=dy)
         )
         self.mouse_listener.start()
-        logging.debug(f"Mouse recording started at {start_time}")
+        logging.debug(f"Mouse recording started at {clock.origin_ns} ns")
 
     def stop(self):
         self.is_recording = False
         if self.mouse_listener:
             self.mouse_listener.stop()
-        self.start_time = None
+            # A callback may still be feeding the path simplifier; flush only after it returned
+            if self.mouse_listener is not threading.current_thread():
+                self.mouse_listener.join()
+        # Keep the last position the pointer moved to
+        self.flush_moves()
+        simplifier = self.path_simplifier
+        if simplifier.points_in:
+            logging.info(f"Path simplifier kept {simplifier.points_out} of {simplifier.points_in} move points")
+        if self.frame_buffer:
+            self.frame_buffer.stop()
+        self.clock = None
         logging.info("Mouse recording stopped")
 
-    def take_screenshot_around_click(self, x, y):
-        """Take screenshot around click position with proper coordinate handling"""
+    def _emit_moves(self, points):
+        for x, y, timestamp, dispatch_ns in points:
+            self.recorder.handle_mouse_event('move', x, y, timestamp, dispatch_ns=dispatch_ns)
+
+    def flush_moves(self):
+        """Emits the pending move point so it precedes the next non-move event"""
+        with self.path_lock:
+            self._emit_moves(self.path_simplifier.flush())
+
+    def break_multi_click(self):
+        """Makes the next left press take its own screenshot; the recognizer will not merge it"""
+        self.last_down_sequence = []
+
+    def _track_multi_click_move(self, sequence, x, y):
+        """Ends the multi-click when the pointer leaves it or the current press becomes a drag"""
+        if self.left_press is not None:
+            anchor, distance = self.left_press, DRAG_SLOP
+        else:
+            anchor, distance = sequence[0], MULTI_CLICK_DISTANCE
+        if abs(x - anchor[1]) > distance or abs(y - anchor[2]) > distance:
+            self.break_multi_click()
+
+    def _continues_multi_click(self, x, y, timestamp):
+        """True if a left press is the second or third click of a multi-click"""
+        sequence = self.last_down_sequence
+        if not sequence or len(sequence) >= 3:
+            return False
+        first_t, first_x, first_y = sequence[0]
+        return (timestamp - sequence[-1][0] <= self.double_click_threshold
+                and abs(x - first_x) <= MULTI_CLICK_DISTANCE and abs(y - first_y) <= MULTI_CLICK_DISTANCE)
+
+    def pending_since(self):
+        """Oldest timestamp of a move still held back by the path simplifier, or None"""
+        return self.path_simplifier.pending_since()
+
+    def wait_for_screenshots(self):
+        """Blocks until all queued screenshots are written to disk"""
+        self.screenshot_pool.wait()
+
+    def take_screenshot_around_click(self, x, y, event_ns=None):
+        """Reserve a screenshot number and queue a capture around the click position"""
         try:
             # Convert any float coordinates to integers and ensure positive values
             x = max(int(round(float(x))), 0)
@@ -61,7 +141,7 @@ class MouseRecorder:
             top = max(y - region_size//2, 0)
             
             # Get screen size to prevent out-of-bounds screenshots
-            screen_width, screen_height = pyautogui.size()
+            screen_width, screen_height = self.screen_size or pyautogui.size()
             
             # Adjust region if it would go beyond screen bounds
             if left + region_size > screen_width:
@@ -69,90 +149,73 @@ class MouseRecorder:
             if top + region_size > screen_height:
                 top = screen_height - region_size
                 
-            self.screenshot_counter += 1
-            screenshot_path = self.screens_dir / f"{self.screenshot_counter}.png"
+            frame = None
+            if self.frame_buffer and event_ns is not None:
+                frame = self.frame_buffer.frame_before(event_ns)
             
-            screenshot = pyautogui.screenshot(region=(left, top, region_size, region_size))
-            screenshot.save(screenshot_path)
-            logging.debug(f"Screenshot saved: {screenshot_path}")
-            return self.screenshot_counter
+            screenshot_num = self.screenshot_counter + 1
+            if not self.screenshot_pool.submit(screenshot_num, (left, top, region_size, region_size), frame):
+                return None
+            self.screenshot_counter = screenshot_num
+            return screenshot_num
             
         except Exception as e:
             logging.exception(f"Error taking screenshot at ({x}, {y}): {e}")
             return None
 
     def on_mouse_event(self, x, y, button=None, pressed=None, delta=0):
-        if not self.is_recording or self.start_time is None:
+        dispatch_ns = now_ns()
+        clock = self.clock
+        if not self.is_recording or clock is None:
             return
             
         try:
-            logging.debug(f"Mouse event detected: x={x}, y={y}, button={button}, pressed={pressed}, delta={delta}")
-            current_time = time.time()
-            timestamp = current_time - self.start_time
-            
-            if (current_time - self.last_timestamp) < self.min_event_interval:
-                return
-                
-            event_data = None
+            if tracer.enabled:
+                tracer.emit('mouse.event', x, y, button, pressed, delta)
+            timestamp = clock.elapsed(dispatch_ns)
             
             # Handle mouse movement
             if button is None and delta == 0:  # Move event
+                sequence = self.last_down_sequence  # The keyboard thread may replace it
+                if sequence:
+                    self._track_multi_click_move(sequence, x, y)
                 x_diff = abs(x - self.last_recorded_pos[0])
                 y_diff = abs(y - self.last_recorded_pos[1])
                 
                 if x_diff > self.mouse_move_threshold or y_diff > self.mouse_move_threshold:
-                    event_data = {
-                        'type': 'move',
-                        'x': x,
-                        'y': y,
-                        'timestamp': timestamp
-                    }
                     self.last_recorded_pos = (x, y)
                     self.last_mouse_position = (x, y)
+                    # Counted now: the simplifier may hold this point back or drop it
+                    self.recorder.record_latency('mouse', dispatch_ns)
+                    with self.path_lock:
+                        self._emit_moves(self.path_simplifier.add((x, y, timestamp, dispatch_ns)))
             
             # Handle click events
             elif pressed is not None:  # Click event
-                if button == mouse.Button.left:
-                    if pressed:
-                        screenshot_num = self.take_screenshot_around_click(x, y)
-                        event_data = {
-                            'type': 'mouseDown',
-                            'x': x, 'y': y,
-                            'button': button.name,
-                            'timestamp': timestamp,
-                            'screenshot': screenshot_num
-                        }
-                        self.last_recorded_pos = (x, y)
-                    else:
-                        event_data = {
-                            'type': 'mouseUp',
-                            'x': x, 'y': y,
-                            'button': button.name,
-                            'timestamp': timestamp
-                        }
-                else:  # Other mouse buttons
-                    event_data = {
-                        'type': 'mouseDown' if pressed else 'mouseUp',
-                        'x': x, 'y': y,
-                        'button': button.name,
-                        'timestamp': timestamp,
-                        'screenshot': None if pressed else None
-                    }
-                self.last_timestamp = current_time
+                self.flush_moves()
+                event_type = 'mouseDown' if pressed else 'mouseUp'
+                screenshot_num = None
+                if button == mouse.Button.left and pressed:
+                    if not self._continues_multi_click(x, y, timestamp):
+                        self.last_down_sequence = []
+                        screenshot_num = self.take_screenshot_around_click(x, y, dispatch_ns)
+                    self.last_down_sequence.append((timestamp, x, y))
+                    self.left_press = (timestamp, x, y)
+                    self.last_recorded_pos = (x, y)
+                elif button == mouse.Button.left:
+                    # A long press is not part of a multi-click either
+                    if self.left_press is not None and timestamp - self.left_press[0] >= LONG_PRESS:
+                        self.break_multi_click()
+                    self.left_press = None
+                elif pressed:
+                    self.break_multi_click()
+                self.recorder.handle_mouse_event(event_type, x, y, timestamp, button=button.name,
+                                                 screenshot=screenshot_num, dispatch_ns=dispatch_ns)
                         
             elif delta:  # Scroll event
-                event_data = {
-                    'type': 'scroll',
-                    'x': x, 'y': y,
-                    'delta': delta,
-                    'timestamp': timestamp
-                }
-                self.last_timestamp = current_time
-                
-            if event_data:
-                logging.debug(f"Prepared event data: {event_data}")
-                self.recorder.handle_mouse_event(event_data)
-                self.last_timestamp = current_time
+                self.flush_moves()
+                self.break_multi_click()
+                self.recorder.handle_mouse_event('scroll', x, y, timestamp, delta=delta, dispatch_ns=dispatch_ns)
                 
         except Exception as e:
             logging.exception(f"Error processing mouse event: {e}")
@@ -169,16 +232,20 @@ def test_recording(duration=10):
     
     # Simple recorder mock class
     class SimpleRecorder:
-        def handle_mouse_event(self, event_data):
-            print(f"Recorded event: {event_data}")
+        def handle_mouse_event(self, event_type, x, y, timestamp, button=None, screenshot=None, delta=0, dispatch_ns=0):
+            print(f"Recorded event: {event_type} at ({x}, {y}) t={timestamp:.3f} button={button} screenshot={screenshot} delta={delta}")
+
+        def record_latency(self, source, dispatch_ns):
+            pass
     
     # Create and start recorder
     recorder = MouseRecorder(temp_dir, SimpleRecorder())
     print(f"Starting recording for {duration} seconds...")
     print("Move your mouse, click, or scroll to generate events")
     
-    start_time = time.time()
-    recorder.start(start_time)
+    clock = EventClock()
+    clock.start()
+    recorder.start(clock)
     
     try:
         time.sleep(duration)
@@ -186,6 +253,7 @@ def test_recording(duration=10):
         print("\nRecording interrupted by user")
     finally:
         recorder.stop()
+        recorder.wait_for_screenshots()
         print(f"Recording stopped. Screenshots saved in: {temp_dir}")
 
 if __name__ == "__main__":
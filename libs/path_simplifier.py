@@ -0,0 +1,74 @@
+import math
+
+def _segment_distance(px, py, ax, ay, bx, by):
+    """Distance from point P to the segment A-B"""
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+class PathSimplifier:
+    """Streaming error-bounded simplification of mouse-move points.
+
+    Opening-window variant of Ramer-Douglas-Peucker: points are buffered
+    after the last kept point (the anchor) for as long as the straight
+    segment from the anchor to the newest point stays within `tolerance`
+    pixels of every buffered point. When it no longer does, the previous
+    point is kept and becomes the new anchor. Points are tuples whose first
+    two items are x and y; anything after that is carried along unchanged.
+    """
+    def __init__(self, tolerance=2.0, max_window=64):
+        self.tolerance = tolerance
+        self.max_window = max_window
+        self.anchor = None
+        self.window = []
+        self.points_in = 0
+        self.points_out = 0
+
+    def reset(self):
+        self.anchor = None
+        self.window = []
+
+    def add(self, point):
+        """Feeds one point; returns the list of points to keep (possibly empty)"""
+        self.points_in += 1
+        if self.anchor is None:
+            return self._keep(point)
+
+        window = self.window
+        if window and (len(window) >= self.max_window or not self._fits(point)):
+            kept = self._keep(window[-1])
+            self.window = [point]
+            return kept
+
+        window.append(point)
+        return []
+
+    def pending_since(self):
+        """Timestamp (third item) of the oldest point not yet kept or dropped, or None"""
+        window = self.window  # May be replaced concurrently; read the reference once
+        return window[0][2] if window else None
+
+    def flush(self):
+        """Keeps the newest pending point, e.g. right before a button press"""
+        if not self.window:
+            return []
+        return self._keep(self.window[-1])
+
+    def _fits(self, point):
+        ax, ay = self.anchor[0], self.anchor[1]
+        bx, by = point[0], point[1]
+        tolerance = self.tolerance
+        for pending in self.window:
+            if _segment_distance(pending[0], pending[1], ax, ay, bx, by) > tolerance:
+                return False
+        return True
+
+    def _keep(self, point):
+        self.anchor = point
+        self.window = []
+        self.points_out += 1
+        return [point]
@@ -1,10 +1,25 @@
+import os
 import time
+import hashlib
+import marshal
+import threading
+import importlib.util
+import multiprocessing
+from collections import OrderedDict
 from pathlib import Path
 import pyautogui
 import traceback
 import sys
 import logging
 
+# Handle both package and direct script usage
+try:
+    from .tracing import tracer
+    from . import macro_runtime
+except ImportError:
+    from tracing import tracer
+    import macro_runtime
+
 # Configure logging with the correct encoding
 logging.basicConfig(level=logging.DEBUG,
                    format='%(asctime)s - %(levelname)s - %(message)s',
@@ -13,11 +28,65 @@ logging.basicConfig(level=logging.DEBUG,
                        logging.StreamHandler(sys.stdout)
                    ])
 
+# Least time between two progress messages of a playback process
+PROGRESS_INTERVAL = 0.05
+
+class _PipeLogHandler(logging.Handler):
+    """Forwards log records of the playback process to the GUI process"""
+    def __init__(self, connection):
+        super().__init__(logging.INFO)
+        self.connection = connection
+        self.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    def emit(self, record):
+        try:
+            self.connection.send(('log', record.levelname, self.format(record)))
+        except Exception:
+            self.handleError(record)
+
+def _play_in_worker(connection, stop_event, code, timing, cache_dir):
+    """Entry point of the playback process; reports to the parent over `connection`"""
+    player = ActionPlayer(cache_dir)
+    player.log_handler = _PipeLogHandler(connection)
+    player.cleanup_logging()
+    last_sent = 0.0
+
+    def observe(index, total, op):
+        nonlocal last_sent
+        if stop_event.is_set():
+            raise macro_runtime.PlaybackStopped
+        now = time.monotonic()
+        if now - last_sent >= PROGRESS_INTERVAL or index == total - 1:
+            last_sent = now
+            connection.send(('progress', index, total, op))
+
+    macro_runtime.set_observer(observe)
+    try:
+        status = 'finished' if player.play(code, timing) else 'error'
+    except pyautogui.FailSafeException:
+        status = 'failsafe'
+    except macro_runtime.PlaybackStopped:
+        status = 'stopped'
+    connection.send(('finished', status))
+    connection.close()
+
 class ActionPlayer:
-    def __init__(self):
+    def __init__(self, cache_dir=None, max_cached=16, max_cached_files=64):
         self.running = False
-        self.log_handler = None
+        self.log_handler = None  # Extra root handler kept across cleanup_logging
         self.log_callback = self._default_log_handler
+        self.progress_callback = None
+        self.finished_callback = None
+        # Playback process started by start()
+        self.process = None
+        self.stop_event = None
+        self.stop_requested = False
+        # Compiled macros by source hash; optionally also marshalled to cache_dir,
+        # which keeps the `max_cached_files` most recently used
+        self.code_cache = OrderedDict()
+        self.max_cached = max_cached
+        self.max_cached_files = max_cached_files
+        self.cache_dir = Path(cache_dir) if cache_dir else None
         
         # Create logs directory if it doesn't exist
         self.logs_dir = Path("logs")
@@ -46,6 +115,8 @@ class ActionPlayer:
                 logging.StreamHandler(sys.stdout)
             ]
         )
+        if self.log_handler:
+            logger.addHandler(self.log_handler)
     
     def _default_log_handler(self, message, level="INFO"):
         """Default handler that prints to console"""
@@ -58,6 +129,14 @@ class ActionPlayer:
         else:
             self.log_callback = callback
 
+    def set_progress_callback(self, callback):
+        """Sets callback(index, total, op) for progress of playbacks run with start()"""
+        self.progress_callback = callback
+
+    def set_finished_callback(self, callback):
+        """Sets callback(status) for the end of playbacks run with start()"""
+        self.finished_callback = callback
+
     def _handle_log(self, message, level="INFO"):
         """Internal method to handle log messages"""
         try:
@@ -66,11 +145,89 @@ class ActionPlayer:
             print(f"Error in log callback: {e}")
             print(f"{level}: {message}")
 
-    def play(self, code):
+    def _cache_path(self, digest):
+        return self.cache_dir / f"{digest.hex()}.{sys.implementation.cache_tag}.pyc"
+
+    def _load_compiled(self, digest):
+        """Reads a marshalled code object written by this Python version for this exact source"""
+        if not self.cache_dir:
+            return None
+        path = self._cache_path(digest)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # Eviction goes by last use
+        except OSError:
+            pass
+        header = importlib.util.MAGIC_NUMBER + digest
+        if not data.startswith(header):
+            return None
+        try:
+            return marshal.loads(data[len(header):])
+        except (EOFError, ValueError, TypeError):
+            logging.warning(f"Ignoring corrupt compiled macro {self._cache_path(digest)}")
+            return None
+
+    def _store_compiled(self, digest, compiled):
+        if not self.cache_dir:
+            return
+        path = self._cache_path(digest)
+        tmp_path = path.with_suffix('.tmp')
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(importlib.util.MAGIC_NUMBER + digest + marshal.dumps(compiled))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not cache compiled macro: {e}")
+            return
+        self._evict_compiled()
+
+    def _evict_compiled(self):
+        """Deletes the least recently used compiled macros beyond max_cached_files"""
+        try:
+            entries = [(entry.stat().st_mtime_ns, entry) for entry in self.cache_dir.glob("*.pyc")]
+        except OSError:
+            return
+        entries.sort(reverse=True)
+        for _, entry in entries[self.max_cached_files:]:
+            try:
+                entry.unlink()
+            except OSError:
+                pass
+
+    def compile_code(self, code):
+        """Returns the code object for a macro, compiling it only on the first play"""
+        digest = hashlib.sha256(code.encode('utf-8')).digest()
+        compiled = self.code_cache.get(digest)
+        if compiled is not None:
+            self.code_cache.move_to_end(digest)
+            return compiled
+        compiled = self._load_compiled(digest)
+        if compiled is None:
+            compiled = compile(code, '<macro>', 'exec')
+            self._store_compiled(digest, compiled)
+        else:
+            logging.debug("Loaded compiled macro from the disk cache")
+        self.code_cache[digest] = compiled
+        if len(self.code_cache) > self.max_cached:
+            self.code_cache.popitem(last=False)
+        return compiled
+
+    def play(self, code, timing=None, backend=None):
+        """Runs a generated macro in this process; returns True when it ran to the end.
+
+        `timing` (a macro_runtime.TimingPolicy) overrides the script's TIMING
+        and `backend` (e.g. a macro_runtime.SimulatedBackend) replaces
+        pyautogui for this run. The pyautogui failsafe and
+        macro_runtime.PlaybackStopped propagate.
+        """
         self.cleanup_logging()
         self.running = True
         logging.info("Beginning playback")
-        logging.debug(f"Code to execute:\n{code}")
+        if tracer.enabled:
+            tracer.emit('player.code', code)
         try:
             # Validate code input
             if not isinstance(code, str):
@@ -88,23 +245,35 @@ class ActionPlayer:
                 'pyautogui': pyautogui,
                 'time': time,
                 'Path': Path,
-                'logging': logging
+                'logging': logging,
+                'macro_runtime': macro_runtime
             }
             
             # Execute the code
             try:
-                exec(code, namespace)
+                exec(self.compile_code(code), namespace)
+                if timing is not None:
+                    namespace['TIMING'] = timing
                 if 'run_script' not in namespace:
                     logging.error("run_script() function not found in the code")
                     return
                     
                 logging.info("Executing run_script()")
                 logging.info("Executing recorded macro")
-                namespace['run_script']()
+                if backend is not None:
+                    previous_backend = macro_runtime.set_backend(backend)
+                try:
+                    namespace['run_script']()
+                finally:
+                    if backend is not None:
+                        macro_runtime.set_backend(previous_backend)
+                return True
                 
             except SyntaxError as se:
                 logging.error(f"Syntax error: {se}")
                 return
+            except (pyautogui.FailSafeException, macro_runtime.PlaybackStopped):
+                raise
             except Exception as e:
                 logging.exception(f"Exception during macro execution: {e}")
                 traceback.print_exc()
@@ -115,11 +284,80 @@ class ActionPlayer:
             logging.info("Playback finished")
             self.cleanup_logging()
             
-    def stop(self):
+    def start(self, code, timing=None):
+        """Plays a macro in a separate process and returns at once.
+
+        Log records and progress of the process go to the log and progress
+        callbacks; the finished callback then gets 'finished', 'failsafe',
+        'error' or 'stopped'. All of them are called from a reader thread.
+        """
+        if self.process is not None:
+            raise RuntimeError("Playback is already running")
+        context = multiprocessing.get_context('spawn')
+        receiver, sender = context.Pipe(duplex=False)
+        self.stop_event = context.Event()
+        self.stop_requested = False
+        self.process = context.Process(target=_play_in_worker, name='macro-playback', daemon=True,
+                                       args=(sender, self.stop_event, code, timing, self.cache_dir))
+        self.running = True
+        self.process.start()
+        sender.close()
+        threading.Thread(target=self._read_worker, args=(receiver, self.process),
+                         name='playback-reader', daemon=True).start()
+        logging.info(f"Playback process {self.process.pid} started")
+
+    def _read_worker(self, connection, process):
+        status = None
+        try:
+            while status is None:
+                message = connection.recv()
+                if message[0] == 'log':
+                    self._handle_log(message[2], message[1])
+                elif message[0] == 'progress':
+                    if self.progress_callback:
+                        self.progress_callback(*message[1:])
+                elif message[0] == 'finished':
+                    status = message[1]
+        except (EOFError, OSError):
+            pass  # The process exited or was killed without reporting
+        finally:
+            connection.close()
+        process.join()
+        if status is None:
+            status = 'stopped' if self.stop_requested else 'error'
+        self.process = None
         self.running = False
+        logging.info(f"Playback process exited with code {process.exitcode} ({status})")
+        if self.finished_callback:
+            self.finished_callback(status)
+
+    def stop(self, grace=0.05):
+        """Asks the playback to stop and returns at once.
+
+        A playback process still running after `grace` seconds is killed
+        from a timer thread, so the caller (normally the GUI thread) never
+        waits for it; the finished callback reports the end as usual.
+        """
+        self.running = False
+        process = self.process
+        if process is not None and process.is_alive():
+            self.stop_requested = True
+            self.stop_event.set()
+            timer = threading.Timer(grace, self._terminate, args=(process,))
+            timer.daemon = True
+            timer.start()
         logging.info("Stopping playback")
         self.cleanup_logging()  # Clean up when stopping
 
+    @staticmethod
+    def _terminate(process):
+        """Kills a playback process that did not stop on its own"""
+        if process.is_alive():
+            process.terminate()
+            process.join(1.0)
+            if process.is_alive():
+                process.kill()
+
 if __name__ == '__main__':
     # Test code for ActionPlayer
     player = ActionPlayer()
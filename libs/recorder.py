@@ -8,23 +8,52 @@ try:
     from .macro_generator import MacroGenerator
     from .keyboard_recorder import KeyboardRecorder
     from .mouse_recorder import MouseRecorder
+    from .event_store import EventStore, NO_SCREENSHOT
+    from .event_clock import EventClock, LatencyHistogram, now_ns
+    from .event_journal import EventJournal
+    from .event_merger import EventMerger
+    from .recording_format import RecordingReader
+    from .tracing import tracer
 except ImportError:
     # When running directly as a script
     from macro_generator import MacroGenerator
     from keyboard_recorder import KeyboardRecorder
     from mouse_recorder import MouseRecorder
+    from event_store import EventStore, NO_SCREENSHOT
+    from event_clock import EventClock, LatencyHistogram, now_ns
+    from event_journal import EventJournal
+    from event_merger import EventMerger
+    from recording_format import RecordingReader
+    from tracing import tracer
 
 class Recorder:
-    def __init__(self):
-        self.actions = []
+    def __init__(self, pre_click_frames=False, near_duplicate_templates=False):
+        # Events are streamed to an on-disk journal so a crash does not lose them
+        self.journal = EventJournal(Path("journal") / "recording.journal")
+        self.actions = EventStore(self.journal)  # All recorded events, appended in place
+        self.segment_starts = []  # First event of each recording session
+        self.original_size = None  # Screen size of a loaded recording; None for this screen
         self.preserved_actions = None  # Add new variable to preserve actions
         self.start_time = None
+        self.clock = EventClock()
+        # Dispatch-to-accept latency per input source
+        self.latency = {'mouse': LatencyHistogram(), 'keyboard': LatencyHistogram()}
         self.running = False
         self.screens_dir = Path("screens")
-        self.clear_screens_directory()
+        # Keep screenshots of an unclean session until the caller recovers or discards it
+        if not self.has_recoverable_session():
+            self.clear_screens_directory()
         self.macro_generator = MacroGenerator()
         self.keyboard_recorder = KeyboardRecorder(self)  # Pass self reference
-        self.mouse_recorder = MouseRecorder(self.screens_dir, self)  # Pass self reference
+        self.mouse_recorder = MouseRecorder(self.screens_dir, self, pre_click_frames)  # Pass self reference
+        # Repeated click templates share the first screenshot instead of writing a new file
+        self.mouse_recorder.screenshot_pool.on_duplicate = self.actions.alias_screenshot
+        # Merging merely similar templates is opt-in; it can alias two states of a control
+        self.mouse_recorder.screenshot_pool.dedup.near_duplicates = near_duplicate_templates
+        # Each listener thread fills its own queue; the merger writes them to the store in time order
+        self.merger = EventMerger(self._store_event, lambda: self.clock.elapsed(now_ns()))
+        self.mouse_queue = self.merger.add_source('mouse', self.mouse_recorder.pending_since)
+        self.keyboard_queue = self.merger.add_source('keyboard')
         
         # Logging setup
         logging.basicConfig(
@@ -34,11 +63,24 @@ class Recorder:
         self.cleanup_logging()
         self._last_generated_code = None  # Add this line
         self.is_recording = False
-        self.current_actions = []  # Temporary storage for current recording
-        self.base_actions = []  # Store all previous recordings
         self.last_timestamp = 0  # Add this line
         logging.info("Recorder initialized")  # Add this line
-    
+
+    @property
+    def segment_start(self):
+        """First event of the current recording session"""
+        return self.segment_starts[-1] if self.segment_starts else 0
+
+    @property
+    def base_actions(self):
+        """Events from all previous recording sessions"""
+        return self.actions[:self.segment_start]
+
+    @property
+    def current_actions(self):
+        """Events from the current recording session"""
+        return self.actions[self.segment_start:]
+
     def cleanup_logging(self):
         """Clean up logging handlers and reinitialize"""
         # Remove all handlers
@@ -64,53 +106,64 @@ class Recorder:
         if self.running:
             self.stop()
         
-        # Reset state for new recording
-        self.current_actions = []
+        # Reset state for new recording; previous events stay in the store
+        self.segment_starts.append(len(self.actions))
+        self.journal.open()
+        self.journal.write_segment(self.segment_start)
         self.running = True
         self.is_recording = True
-        self.start_time = time.time()  # Set start_time first
+        self.start_time = time.time()  # Wall time, for logging only
         self.last_timestamp = self.start_time
+        self.clock.start()  # Event timestamps come from the monotonic clock
+        for histogram in self.latency.values():
+            histogram.reset()
         logging.debug(f"Starting new recording. Running: {self.running}, Start time: {self.start_time}")
-        
-        # Store previous actions if any exist
-        if self.actions:
-            self.base_actions = self.actions.copy()
             
-        # Start listeners
-        self.mouse_recorder.start(self.start_time)
-        # self.keyboard_recorder.start(self.start_time)
+        # Start the merger before the listeners so no event waits on it
+        self.merger.start()
+        self.mouse_recorder.start(self.clock)
+        self.keyboard_recorder.start(self.clock)
         logging.info(f"Started new recording session at {self.start_time:.3f} (existing actions: {len(self.base_actions)})")
 
     def stop(self):
         """Stops recording and generates macro code"""
         if not self.running:
-            return self._last_generated_code or self.macro_generator.generate_code(self.actions)
+            return self._last_generated_code or self._generate(self.actions)
         
         logging.info("Stopping recording...")
         self.running = False
-        self.is_recording = False
         logging.debug("Stopping recording")
         
-        # Stop listeners first
+        # Stop listeners first; they may still flush pending events
         self.keyboard_recorder.stop()
         self.mouse_recorder.stop()
+        self.is_recording = False
+        # Merge whatever is still queued before the store is read
+        self.merger.stop()
+        
+        # Screenshots are written in the background; wait until they exist
+        self.mouse_recorder.wait_for_screenshots()
         
         # Clear timing variables last
         self.start_time = None
         self.last_timestamp = 0
+        self.clock.stop()
+        for source, stats in self.latency_report().items():
+            if stats['count']:
+                logging.info(f"{source} input latency: p50={stats['p50_ms']:.3f}ms "
+                             f"p99={stats['p99_ms']:.3f}ms max={stats['max_ms']:.3f}ms ({stats['count']} events)")
         
         # Combine base actions with current recording
         if self.current_actions:  # Only combine if there are new actions
-            self.actions = self.base_actions + self.current_actions
             logging.info(f"Combined {len(self.base_actions)} previous actions with {len(self.current_actions)} new actions")
             logging.debug(f"Generating code from {len(self.actions)} actions")
             
-            # Generate code
-            self._last_generated_code = self.macro_generator.generate_code(self.actions)
+            # Generate code; earlier sessions come from the generator's cache
+            self._last_generated_code = self._generate(self.actions)
             return self._last_generated_code
         elif self.base_actions:  # Return existing code if no new actions
             logging.debug(f"No new actions. Generating code from base actions ({len(self.base_actions)} actions)")
-            self._last_generated_code = self.macro_generator.generate_code(self.base_actions)
+            self._last_generated_code = self._generate(self.base_actions)
             return self._last_generated_code
         else:
             logging.warning("No actions recorded")
@@ -118,77 +171,181 @@ class Recorder:
             return ""
 
     def generate_code(self):
-        """Optimize generated code for smoother playback"""
+        """Regenerates the macro code from all recorded actions.
+
+        Moves, clicks and scrolls are thinned by the generator's optimizer
+        pipeline (see MacroGenerator.optimizer), the same as on stop().
+        """
         if not self.actions:
             return None
-            
-        # Optimize mouse movements by reducing redundant points
-        optimized_actions = []
-        last_move = None
-        logging.debug("Optimizing actions for code generation")
-        
-        for action in self.actions:
-            if action[0] == 'move':
-                if not last_move or (time.time() - last_move[-1]) > 0.05:
-                    optimized_actions.append(action)
-                    last_move = action
-            else:
-                optimized_actions.append(action)
-        
-        logging.debug(f"Optimized actions count: {len(optimized_actions)}")
-        self._last_generated_code = self.macro_generator.generate_code(optimized_actions)
+        self._last_generated_code = self._generate(self.actions)
         return self._last_generated_code
 
-    def clear_recording(self):
-        """Clear all recorded actions"""
-        self.actions = []
-        self.base_actions = []
-        self.current_actions = []
-        self.screenshot_counter = 0
+    def clear_recording(self, keep_screens=False):
+        """Clear all recorded actions, and the screenshots unless `keep_screens`"""
+        self.journal.close()
+        self.actions.clear()
+        self.segment_starts = []
+        self.original_size = None
+        self.macro_generator.clear_cache()
+        self.mouse_recorder.wait_for_screenshots()
+        self.mouse_recorder.screenshot_counter = 0
+        self.mouse_recorder.screenshot_pool.dedup.clear()
         self._last_generated_code = None
-        self.clear_screens_directory()
+        if not keep_screens:
+            self.clear_screens_directory()
         logging.info("Cleared all recorded actions")
         logging.info("All recorded actions cleared")
 
-    def handle_keyboard_event(self, event_data):
+    def close(self):
+        """Stops recording and removes the journal; call on a clean application exit"""
+        if self.running:
+            self.stop()
+        self.mouse_recorder.wait_for_screenshots()
+        self.journal.close()
+        logging.info("Recorder closed")
+
+    def has_recoverable_session(self):
+        """True if a journal was left behind by a session that did not exit cleanly"""
+        return not self.journal.is_open and self.journal.path.exists()
+
+    def recover_session(self):
+        """Rebuilds the actions and screenshot mapping from an unclean journal and returns the macro code"""
+        events, strings, aliases, segments, checkpoints, valid_length = EventJournal.replay(self.journal.path)
+        available = {int(p.stem) for p in self.screens_dir.glob("*.png") if p.stem.isdigit()}
+        
+        self.actions.clear()
+        self.macro_generator.clear_cache()
+        self.journal.restore(valid_length, len(events), checkpoints)
+        self.journal.open()
+        self.actions.load_journal_events(events, strings, aliases, lambda num: num in available)
+        self.segment_starts = segments or [0]
+        # New screenshots must not reuse an id the journal refers to, even if its file is missing
+        used = {event[6] for event in events if event[6] != NO_SCREENSHOT}
+        used.update(aliases, aliases.values())
+        self.mouse_recorder.screenshot_counter = max(available | used, default=0)
+        # Later clicks may repeat a template saved before the crash
+        self.mouse_recorder.screenshot_pool.dedup.load(self.screens_dir, available)
+        logging.info(f"Recovered {len(events)} actions from {self.journal.path}")
+        
+        self._last_generated_code = self._generate(self.actions) if self.actions else ""
+        return self._last_generated_code
+
+    def discard_recovered_session(self):
+        """Drops a journal left behind by an unclean exit"""
+        if self.has_recoverable_session():
+            self.journal.path.unlink()
+        self.clear_screens_directory()
+        logging.info("Discarded unrecovered recording")
+
+    def save_recording(self, path):
+        """Writes all recorded events to a binary recording file"""
+        self.mouse_recorder.wait_for_screenshots()
+        return self.macro_generator.save_recording(path, self.actions, self.segment_starts,
+                                                   original_size=self.original_size)
+
+    def load_recording(self, path):
+        """Replaces the recorded events with those of a binary recording and returns the macro code.
+
+        The recording refers to screenshots by id only, so the screens
+        directory is kept and new screenshots are numbered past every id
+        found there or in the recording.
+        """
+        if self.running:
+            self.stop()
+        self.clear_recording(keep_screens=True)
+        used = set()
+        with RecordingReader(path) as recording:
+            for start in recording.segments:
+                self.segment_starts.append(start)
+                self.journal.open()
+                self.journal.write_segment(start)
+            for action in recording:
+                if action[0] == 'mouseDown' and action[5] is not None:
+                    used.add(action[5])
+                self._append_action(action)
+            self.original_size = tuple(recording.screen_size)
+            self._last_generated_code = self._generate(self.actions)
+        available = {int(p.stem) for p in self.screens_dir.glob("*.png") if p.stem.isdigit()}
+        self.mouse_recorder.screenshot_counter = max(available | used, default=0)
+        self.mouse_recorder.screenshot_pool.dedup.load(self.screens_dir, available)
+        logging.info(f"Loaded {len(self.actions)} actions from {path}")
+        return self._last_generated_code
+
+    def _generate(self, actions):
+        """Generates code for a prefix of the store, one cached render per recording session.
+
+        Coordinates are scaled from the screen of a loaded recording, if any.
+        """
+        return self.macro_generator.generate_code(actions, original_size=self.original_size,
+                                                  segments=self.segment_starts)
+
+    def _append_action(self, action):
+        """Appends a legacy action tuple to the event store"""
+        kind = action[0]
+        if kind == 'move':
+            self.actions.append_move(action[1], action[2], action[3])
+        elif kind == 'mouseDown':
+            self.actions.append_button(kind, action[1], action[2], action[3], action[4], action[5])
+        elif kind == 'mouseUp':
+            self.actions.append_button(kind, action[1], action[2], action[3], action[4])
+        elif kind == 'scroll':
+            self.actions.append_scroll(action[1], action[2], action[4], action[5])
+        else:
+            self.actions.append_key(kind, action[1], action[2])
+
+    def dump_trace(self, path=None):
+        """Writes the hot-path trace ring to `path` (or the log) and returns the lines"""
+        return tracer.dump(path)
+
+    def latency_report(self):
+        """Returns per-source dispatch-to-accept latency (count, p50/p99/max in ms) for the last session"""
+        return {source: histogram.summary() for source, histogram in self.latency.items()}
+
+    def record_latency(self, source, dispatch_ns):
+        """Counts one input event of `source` dispatched at `dispatch_ns` as accepted now"""
+        if self.is_recording and dispatch_ns:
+            self.latency[source].record(now_ns() - dispatch_ns)
+
+    def handle_keyboard_event(self, event_type, key, timestamp, dispatch_ns=0):
         """Handle keyboard events from KeyboardRecorder"""
-        if event_data and self.is_recording:
-            event_type = event_data['type']
-            key = event_data['key']
-            timestamp = event_data['timestamp']
-            self.current_actions.append((event_type, key, timestamp))
-            logging.debug(f"Keyboard event received: {event_data}")
-
-    def handle_mouse_event(self, event_data):
+        if self.is_recording:
+            accept_ns = now_ns()
+            if dispatch_ns:
+                self.latency['keyboard'].record(accept_ns - dispatch_ns)
+            if tracer.enabled:
+                tracer.emit('recorder.keyboard', event_type, key, timestamp)
+            # A key between two clicks keeps them from forming a multi-click
+            self.mouse_recorder.break_multi_click()
+            # A move held by the path simplifier happened before this key; queue it first
+            # instead of letting the merger give up on it and clamp it behind the key
+            self.mouse_recorder.flush_moves()
+            self.keyboard_queue.append((timestamp, (event_type, key, dispatch_ns, accept_ns)))
+
+    def handle_mouse_event(self, event_type, x, y, timestamp, button=None, screenshot=None, delta=0, dispatch_ns=0):
         """Handle mouse events from MouseRecorder"""
-        if event_data and self.is_recording:
-            event_type = event_data['type']
-            if event_type == 'move':
-                self.current_actions.append((
-                    'move',
-                    event_data['x'],
-                    event_data['y'],
-                    event_data['timestamp']
-                ))
-            elif event_type in ['mouseDown', 'mouseUp']:
-                self.current_actions.append((
-                    event_type,
-                    event_data['x'],
-                    event_data['y'],
-                    event_data['button'],
-                    event_data['timestamp'],
-                    event_data.get('screenshot')
-                ))
-            elif event_type == 'scroll':
-                self.current_actions.append((
-                    'scroll',
-                    event_data['x'],
-                    event_data['y'],
-                    0,  # Horizontal scroll (legacy parameter)
-                    event_data['delta'],
-                    event_data['timestamp']
-                ))
-            logging.debug(f"Mouse event received: {event_data}")
+        if self.is_recording:
+            accept_ns = now_ns()
+            # Moves are counted on reaching the path simplifier, which may have held this one
+            if dispatch_ns and event_type != 'move':
+                self.latency['mouse'].record(accept_ns - dispatch_ns)
+            if tracer.enabled:
+                tracer.emit('recorder.mouse', event_type, x, y, timestamp, button, screenshot, delta)
+            self.mouse_queue.append((timestamp, (event_type, x, y, button, screenshot, delta, dispatch_ns, accept_ns)))
+
+    def _store_event(self, source, timestamp, event):
+        """Writes one merged event to the store; runs on the merge thread"""
+        if source == 'keyboard':
+            event_type, key, dispatch_ns, accept_ns = event
+            self.actions.append_key(event_type, key, timestamp, dispatch_ns, accept_ns)
+            return
+        event_type, x, y, button, screenshot, delta, dispatch_ns, accept_ns = event
+        if event_type == 'move':
+            self.actions.append_move(x, y, timestamp, dispatch_ns, accept_ns)
+        elif event_type in ['mouseDown', 'mouseUp']:
+            self.actions.append_button(event_type, x, y, button, timestamp, screenshot, dispatch_ns, accept_ns)
+        elif event_type == 'scroll':
+            self.actions.append_scroll(x, y, delta, timestamp, dispatch_ns, accept_ns)
 
 def test_recorder():
     """Simple test function to demonstrate recorder functionality"""
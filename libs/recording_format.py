@@ -0,0 +1,259 @@
+import os
+import mmap
+import struct
+import bisect
+import logging
+
+# Handle both package and direct script usage
+try:
+    from .event_store import EVENT_TYPES, EVENT_CODES
+except ImportError:
+    from event_store import EVENT_TYPES, EVENT_CODES
+
+MAGIC = b'PAMR'
+VERSION = 1
+
+# magic, version, flags, event count, screen width, screen height,
+# string table offset, index offset, segment table offset
+HEADER_STRUCT = struct.Struct('<4sHHIiiQQQ')
+# type, flags, button string id, dx, dy, dt (microseconds), extra
+RECORD_STRUCT = struct.Struct('<BBHhhii')
+# first row, segment, timestamp, x, y, file offset of the first record
+INDEX_STRUCT = struct.Struct('<IIdiiQ')
+COUNT_STRUCT = struct.Struct('<I')
+LENGTH_STRUCT = struct.Struct('<H')
+
+FLAG_SCREENSHOT = 1
+NO_STRING = 0xFFFF
+BLOCK_SIZE = 4096
+
+def _action_fields(action):
+    """Splits an action tuple into (type, x, y, timestamp, button, extra, screenshot)"""
+    kind = action[0]
+    if kind == 'move':
+        _, x, y, timestamp = action
+        return kind, x, y, timestamp, None, 0, None
+    if kind == 'mouseDown':
+        _, x, y, button, timestamp, screenshot = action
+        return kind, x, y, timestamp, button, 0, screenshot
+    if kind == 'mouseUp':
+        _, x, y, button, timestamp = action
+        return kind, x, y, timestamp, button, 0, None
+    if kind == 'scroll':
+        _, x, y, _, delta, timestamp = action
+        return kind, x, y, timestamp, None, delta, None
+    if kind in ('keydown', 'keyup'):
+        _, key, timestamp = action
+        return kind, 0, 0, timestamp, key, 0, None
+    raise ValueError(f"Action type {kind!r} cannot be stored in a recording")
+
+def write_recording(path, actions, screen_size, segments=()):
+    """Writes action tuples to a versioned binary recording.
+
+    Records are 16 bytes with coordinates and timestamps delta-encoded
+    against the previous record of the same block. Each block starts at an
+    index entry holding absolute values, so a reader can jump to any row or
+    time without decoding what comes before it.
+    """
+    path = str(path)
+    segment_starts = sorted(set(segments) | {0})
+    strings = []
+    string_ids = {}
+    index = []
+    count = 0
+    prev = None
+
+    def intern(value):
+        if value is None:
+            return NO_STRING
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = string_ids[value] = len(strings)
+            strings.append(value)
+        return string_id
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * HEADER_STRUCT.size)
+        for action in actions:
+            kind, x, y, timestamp, label, extra, screenshot = _action_fields(action)
+            x = int(round(x))
+            y = int(round(y))
+            segment = bisect.bisect_right(segment_starts, count) - 1
+            if prev is not None:
+                dx = x - prev[0]
+                dy = y - prev[1]
+                dt = int(round((timestamp - prev[2]) * 1e6))
+            new_block = (
+                prev is None
+                or count - index[-1][0] >= BLOCK_SIZE
+                or segment != index[-1][1]
+                or not -32768 <= dx <= 32767
+                or not -32768 <= dy <= 32767
+                or not -2**31 <= dt < 2**31
+            )
+            if new_block:
+                index.append((count, segment, timestamp, x, y, f.tell()))
+                dx = dy = dt = 0
+            flags = 0
+            if screenshot is not None:
+                flags |= FLAG_SCREENSHOT
+                extra = screenshot
+            elif kind in ('keydown', 'keyup'):
+                extra = intern(label)
+                label = None
+            f.write(RECORD_STRUCT.pack(EVENT_CODES[kind], flags, intern(label), dx, dy, dt, int(extra)))
+            # Follow the decoded values so rounding never accumulates
+            if new_block:
+                prev = (x, y, timestamp)
+            else:
+                prev = (x, y, prev[2] + dt / 1e6)
+            count += 1
+
+        strings_offset = f.tell()
+        f.write(COUNT_STRUCT.pack(len(strings)))
+        for value in strings:
+            encoded = value.encode('utf-8')
+            f.write(LENGTH_STRUCT.pack(len(encoded)) + encoded)
+
+        index_offset = f.tell()
+        f.write(COUNT_STRUCT.pack(len(index)))
+        for entry in index:
+            f.write(INDEX_STRUCT.pack(*entry))
+
+        segments_offset = f.tell()
+        f.write(COUNT_STRUCT.pack(len(segment_starts)))
+        for start in segment_starts:
+            f.write(COUNT_STRUCT.pack(start))
+
+        f.seek(0)
+        f.write(HEADER_STRUCT.pack(MAGIC, VERSION, 0, count, int(screen_size[0]), int(screen_size[1]),
+                                   strings_offset, index_offset, segments_offset))
+    os.replace(tmp_path, path)
+    logging.info(f"Wrote {count} events to recording {path}")
+    return count
+
+class RecordingReader:
+    """Random access to a binary recording through mmap.
+
+    Only the header, string table and block index are parsed up front;
+    records are decoded on demand from the block that contains them.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.count, width, height,
+         strings_offset, index_offset, segments_offset) = HEADER_STRUCT.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a macro recording")
+        if version > VERSION:
+            self.close()
+            raise ValueError(f"Recording version {version} is newer than supported version {VERSION}")
+        self.screen_size = (width, height)
+
+        self.strings = []
+        offset = strings_offset + COUNT_STRUCT.size
+        for _ in range(COUNT_STRUCT.unpack_from(self.map, strings_offset)[0]):
+            length = LENGTH_STRUCT.unpack_from(self.map, offset)[0]
+            offset += LENGTH_STRUCT.size
+            self.strings.append(self.map[offset:offset + length].decode('utf-8'))
+            offset += length
+
+        self.index = list(INDEX_STRUCT.iter_unpack(self.map[
+            index_offset + COUNT_STRUCT.size:
+            index_offset + COUNT_STRUCT.size + COUNT_STRUCT.unpack_from(self.map, index_offset)[0] * INDEX_STRUCT.size
+        ]))
+        self.block_rows = [entry[0] for entry in self.index]
+
+        segment_count = COUNT_STRUCT.unpack_from(self.map, segments_offset)[0]
+        self.segments = [start for (start,) in COUNT_STRUCT.iter_unpack(self.map[
+            segments_offset + COUNT_STRUCT.size:
+            segments_offset + COUNT_STRUCT.size + segment_count * COUNT_STRUCT.size
+        ])]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    def __iter__(self):
+        return self.iter_actions(0, self.count)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                raise ValueError("Recording slices do not support a step")
+            return list(self.iter_actions(start, stop))
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("event index out of range")
+        return next(self.iter_actions(index, index + 1))
+
+    def iter_actions(self, start, stop):
+        """Yields action tuples for rows start..stop-1, decoding from the enclosing block"""
+        stop = min(stop, self.count)
+        if start >= stop:
+            return
+        block = bisect.bisect_right(self.block_rows, start) - 1
+        row, _, timestamp, x, y, offset = self.index[block]
+        next_block_row = self.block_rows[block + 1] if block + 1 < len(self.index) else self.count
+        strings = self.strings
+        while row < stop:
+            if row == next_block_row:
+                block += 1
+                _, _, timestamp, x, y, offset = self.index[block]
+                next_block_row = self.block_rows[block + 1] if block + 1 < len(self.index) else self.count
+                code, flags, label, dx, dy, dt, extra = RECORD_STRUCT.unpack_from(self.map, offset)
+            else:
+                code, flags, label, dx, dy, dt, extra = RECORD_STRUCT.unpack_from(self.map, offset)
+                x += dx
+                y += dy
+                timestamp += dt / 1e6
+            offset += RECORD_STRUCT.size
+            if row >= start:
+                kind = EVENT_TYPES[code]
+                if kind == 'move':
+                    yield ('move', x, y, timestamp)
+                elif kind == 'mouseDown':
+                    yield ('mouseDown', x, y, strings[label], timestamp, extra if flags & FLAG_SCREENSHOT else None)
+                elif kind == 'mouseUp':
+                    yield ('mouseUp', x, y, strings[label], timestamp)
+                elif kind == 'scroll':
+                    yield ('scroll', x, y, 0, extra, timestamp)
+                else:
+                    yield (kind, strings[extra], timestamp)
+            row += 1
+
+    def index_of_time(self, timestamp, segment=0):
+        """Returns the first row of `segment` recorded at or after `timestamp`"""
+        blocks = [entry for entry in self.index if entry[1] == segment]
+        if not blocks:
+            raise ValueError(f"Recording has no segment {segment}")
+        times = [entry[2] for entry in blocks]
+        block = max(0, bisect.bisect_right(times, timestamp) - 1)
+        row = blocks[block][0]
+        segment_end = self.segments[segment + 1] if segment + 1 < len(self.segments) else self.count
+        for action in self.iter_actions(row, segment_end):
+            if action[-2 if action[0] == 'mouseDown' else -1] >= timestamp:
+                return row
+            row += 1
+        return segment_end
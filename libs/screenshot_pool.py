@@ -0,0 +1,107 @@
+import queue
+import threading
+import logging
+import pyautogui
+
+# Handle both package and direct script usage
+try:
+    from .template_dedup import TemplateDeduplicator
+    from .tracing import tracer
+except ImportError:
+    from template_dedup import TemplateDeduplicator
+    from tracing import tracer
+
+class ScreenshotPool:
+    """Bounded queue of click-region captures served by a small pool of worker threads.
+
+    The pynput callback only reserves a screenshot number and enqueues the
+    region; grabbing, cropping, PNG encoding and writing happen here. When a
+    pre-click frame is supplied the region is cropped from it instead of
+    grabbing the screen again. Crops that duplicate an earlier template are
+    not written; `on_duplicate(screenshot_num, existing_num)` is called instead.
+    """
+    def __init__(self, screens_dir, workers=2, max_pending=64, put_timeout=0.05):
+        self.screens_dir = screens_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.threads = []
+        self.dropped = 0
+        self.screen_size = None
+        self.dedup = TemplateDeduplicator()
+        self.on_duplicate = None
+        logging.info("ScreenshotPool initialized")
+
+    def start(self):
+        """Starts the worker threads if they are not running yet"""
+        self.threads = [t for t in self.threads if t.is_alive()]
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"screenshot-worker-{len(self.threads)}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, screenshot_num, region, frame=None):
+        """Queues a capture request. Returns False if the queue stayed full"""
+        try:
+            self.queue.put((screenshot_num, region, frame), timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logging.warning(f"Screenshot queue full, dropping capture {screenshot_num}")
+            return False
+
+    def wait(self):
+        """Blocks until every queued capture has been written"""
+        self.queue.join()
+
+    def stop(self):
+        """Drains the queue and shuts down the workers"""
+        self.wait()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _worker(self):
+        while True:
+            request = self.queue.get()
+            try:
+                if request is None:
+                    return
+                self._capture(*request)
+            finally:
+                self.queue.task_done()
+
+    def _crop_frame(self, frame, region):
+        """Crops a logical-coordinate region from a full frame, honouring HiDPI scaling"""
+        left, top, width, height = region
+        scale = 1.0
+        if self.screen_size and self.screen_size[0]:
+            scale = frame.width / self.screen_size[0]
+        return frame.crop((
+            int(left * scale),
+            int(top * scale),
+            int((left + width) * scale),
+            int((top + height) * scale)
+        ))
+
+    def _capture(self, screenshot_num, region, frame=None):
+        screenshot_path = self.screens_dir / f"{screenshot_num}.png"
+        try:
+            if frame is not None:
+                screenshot = self._crop_frame(frame, region)
+            else:
+                screenshot = pyautogui.screenshot(region=region)
+            if self.dedup:
+                existing = self.dedup.find_or_add(screenshot_num, screenshot)
+                if existing != screenshot_num:
+                    if self.on_duplicate:
+                        self.on_duplicate(screenshot_num, existing)
+                    return
+            screenshot.save(screenshot_path)
+            if tracer.enabled:
+                tracer.emit('screenshot.saved', screenshot_num)
+        except Exception as e:
+            logging.exception(f"Error capturing screenshot {screenshot_num} at {region}: {e}")
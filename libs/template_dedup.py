@@ -0,0 +1,97 @@
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+# Handle both package and direct script usage
+try:
+    from .tracing import tracer
+except ImportError:
+    from tracing import tracer
+
+class TemplateDeduplicator:
+    """Finds click templates that repeat an earlier screenshot of the session.
+
+    Identical crops are matched by a hash of their pixels, so a duplicate
+    can reuse the earlier screenshot id instead of being encoded and written
+    again. With `near_duplicates` near-identical crops (the same button
+    clicked a few pixels apart) are merged too: they are matched by a 64-bit
+    difference hash and confirmed with a small grayscale thumbnail. That is
+    off by default since two states of a control (a checkbox ticked or not)
+    can be that close and the macro would then search for the wrong one.
+    """
+    def __init__(self, near_duplicates=False, max_distance=3, max_mean_diff=6.0):
+        self.near_duplicates = near_duplicates
+        self.max_distance = max_distance
+        self.max_mean_diff = max_mean_diff
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.exact = {}  # pixel digest -> screenshot id
+            self.perceptual = []  # (dhash, thumbnail, size, screenshot id)
+            self.hits = 0
+
+    def load(self, screens_dir, screenshot_nums):
+        """Forgets all templates and registers those already saved in `screens_dir` under `screenshot_nums`"""
+        self.clear()
+        for screenshot_num in sorted(screenshot_nums):
+            path = Path(screens_dir) / f"{screenshot_num}.png"
+            try:
+                with Image.open(path) as image:
+                    self.find_or_add(screenshot_num, image.convert('RGB'))
+            except OSError as e:
+                logging.warning(f"Could not index screenshot {path}: {e}")
+        self.hits = 0
+
+    @staticmethod
+    def _digest(image):
+        return hashlib.blake2b(image.mode.encode() + repr(image.size).encode() + image.tobytes(),
+                               digest_size=16).digest()
+
+    @staticmethod
+    def _dhash(image):
+        gray = image.convert('L').resize((9, 8))
+        pixels = list(gray.getdata())
+        value = 0
+        for row in range(8):
+            for col in range(8):
+                value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        return value
+
+    @staticmethod
+    def _thumbnail(image):
+        return bytes(image.convert('L').resize((16, 16)).getdata())
+
+    def find_or_add(self, screenshot_num, image):
+        """Returns the id of an equivalent earlier template, or registers this one and returns its own id"""
+        digest = self._digest(image)
+        dhash = None
+        thumbnail = None
+        if self.near_duplicates:
+            dhash = self._dhash(image)
+            thumbnail = self._thumbnail(image)
+
+        with self.lock:
+            existing = self.exact.get(digest)
+            if existing is None and dhash is not None:
+                for other_hash, other_thumbnail, other_size, other_num in self.perceptual:
+                    if other_size != image.size or bin(dhash ^ other_hash).count('1') > self.max_distance:
+                        continue
+                    mean_diff = sum(abs(a - b) for a, b in zip(thumbnail, other_thumbnail)) / len(thumbnail)
+                    if mean_diff <= self.max_mean_diff:
+                        existing = other_num
+                        break
+            if existing is not None:
+                self.hits += 1
+                if tracer.enabled:
+                    tracer.emit('screenshot.duplicate', screenshot_num, existing)
+                return existing
+
+            self.exact[digest] = screenshot_num
+            if dhash is not None:
+                self.perceptual.append((dhash, thumbnail, image.size, screenshot_num))
+            return screenshot_num
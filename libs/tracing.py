@@ -0,0 +1,80 @@
+import os
+import itertools
+import logging
+from array import array
+
+# Handle both package and direct script usage
+try:
+    from .event_clock import now_ns
+except ImportError:
+    from event_clock import now_ns
+
+class Tracer:
+    """Near zero-cost tracing for the recording and playback hot paths.
+
+    Call sites check `tracer.enabled` before building anything, so a
+    disabled tracer costs one attribute lookup. When enabled, every
+    `sample_every`-th record is stored unformatted in a preallocated ring;
+    formatting only happens in `dump()`.
+    """
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.stamps = array('q', [0]) * capacity
+        self.names = [None] * capacity
+        self.fields = [None] * capacity
+        self.enabled = False
+        self.sample_every = 1
+        self.sequence = itertools.count()
+        self.written = 0
+
+    def enable(self, sample_every=1):
+        self.sample_every = max(1, int(sample_every))
+        self.enabled = True
+        logging.info(f"Tracing enabled (sampling 1 in {self.sample_every})")
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        for slot in range(self.capacity):
+            self.names[slot] = None
+            self.fields[slot] = None
+        self.sequence = itertools.count()
+        self.written = 0
+
+    def emit(self, name, *fields):
+        """Stores one record; callers must check `enabled` first"""
+        seq = next(self.sequence)  # atomic under the GIL, safe across listener threads
+        if seq % self.sample_every:
+            return
+        slot = (seq // self.sample_every) % self.capacity
+        self.stamps[slot] = now_ns()
+        self.names[slot] = name
+        self.fields[slot] = fields
+        self.written += 1
+
+    def records(self):
+        """Returns the buffered records, oldest first, as (stamp_ns, name, fields)"""
+        records = [(self.stamps[slot], self.names[slot], self.fields[slot])
+                   for slot in range(self.capacity) if self.names[slot] is not None]
+        records.sort(key=lambda record: record[0])
+        return records
+
+    def dump(self, path=None):
+        """Formats the ring into text lines; writes them to `path` or the log"""
+        lines = [f"{stamp} {name} {' '.join(repr(field) for field in fields)}"
+                 for stamp, name, fields in self.records()]
+        if path is None:
+            for line in lines:
+                logging.debug(line)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+            logging.info(f"Wrote {len(lines)} trace records to {path}")
+        return lines
+
+# Shared tracer; MACRO_TRACE=<N> enables it with 1-in-N sampling
+tracer = Tracer()
+_trace_env = os.environ.get('MACRO_TRACE', '0')
+if _trace_env != '0':
+    tracer.enable(_trace_env if _trace_env.isdigit() else 1)
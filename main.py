@@ -1,3 +1,5 @@
+import multiprocessing
+from pathlib import Path
 from PySide6 import QtWidgets, QtCore
 from libs.recorder import Recorder
 from libs.player import ActionPlayer
@@ -8,14 +10,24 @@ def main():
     
     # Initialize components
     recorder = Recorder()
-    player = ActionPlayer()
     settings = QtCore.QSettings('PyAutoGUI-Macro', 'Recorder')
+    # Compiled macros go to the per-user cache, named like the settings; the
+    # application directory may be read-only or a temporary extraction
+    app.setOrganizationName('PyAutoGUI-Macro')
+    app.setApplicationName('Recorder')
+    cache_root = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.CacheLocation)
+    player = ActionPlayer(cache_dir=Path(cache_root) / "macros" if cache_root else None)
     
     # Create and show main window
     window = MainWindow(recorder, player, settings)
     window.show()
     
-    return app.exec()
+    result = app.exec()
+    # Clean exit: the crash-recovery journal is no longer needed
+    recorder.close()
+    return result
 
 if __name__ == "__main__":
+    # Playback runs in a spawned process, which frozen builds must be able to start
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
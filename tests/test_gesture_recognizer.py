@@ -0,0 +1,37 @@
+"""Gesture recognition over recorded mouse actions"""
+from libs.gesture_recognizer import GestureRecognizer
+
+def _recognize(actions):
+    return list(GestureRecognizer().recognize(actions))
+
+def test_straight_drag_is_a_single_step():
+    actions = [
+        ('mouseDown', 100, 100, 'left', 0.0, 1),
+        ('move', 110, 105, 0.1),
+        ('move', 121, 110, 0.2),
+        ('mouseUp', 130, 115, 'left', 0.3),
+    ]
+    assert _recognize(actions) == [('drag', 100, 100, 'left', ((30, 15, 0.3),), 0.3, 0.0, 1)]
+
+def test_curved_drag_keeps_its_waypoints():
+    actions = [
+        ('mouseDown', 100, 100, 'left', 0.0, 1),
+        ('move', 110, 130, 0.1),
+        ('mouseUp', 130, 115, 'left', 0.3),
+    ]
+    assert _recognize(actions) == [('drag', 100, 100, 'left', ((10, 30, 0.1), (30, 15, 0.2)), 0.3, 0.0, 1)]
+
+def test_drag_right_after_a_click_uses_the_click_template():
+    # The recorder does not capture a press that may be the second click of a double-click
+    actions = [
+        ('mouseDown', 100, 100, 'left', 0.0, 1),
+        ('mouseUp', 100, 100, 'left', 0.05),
+        ('mouseDown', 101, 100, 'left', 0.2, None),
+        ('move', 140, 100, 0.3),
+        ('mouseUp', 160, 100, 'left', 0.4),
+    ]
+    assert _recognize(actions) == [
+        ('mouseDown', 100, 100, 'left', 0.0, 1),
+        ('mouseUp', 100, 100, 'left', 0.05),
+        ('drag', 101, 100, 'left', ((59, 0, 0.2),), 0.2, 0.2, 1),
+    ]
@@ -0,0 +1,195 @@
+"""Playback runtime checks on the simulated backend: no display, no real input, virtual time"""
+import random
+import sys
+import time
+import threading
+
+import pytest
+from PIL import Image
+
+from libs import macro_runtime
+
+SCREEN_SIZE = (800, 600)
+TEMPLATE_SIZE = 40
+
+def _noise(seed):
+    rng = random.Random(seed)
+    return Image.frombytes('RGB', (TEMPLATE_SIZE, TEMPLATE_SIZE),
+                           bytes(rng.randrange(256) for _ in range(TEMPLATE_SIZE * TEMPLATE_SIZE * 3)))
+
+def _center(position):
+    return (position[0] + TEMPLATE_SIZE // 2, position[1] + TEMPLATE_SIZE // 2)
+
+@pytest.fixture
+def screens(tmp_path):
+    """Two templates saved as screenshots 1 and 2"""
+    directory = tmp_path / 'screens'
+    directory.mkdir()
+    templates = {1: _noise(1), 2: _noise(2)}
+    for number, template in templates.items():
+        template.save(directory / f'{number}.png')
+    return directory, templates
+
+def _backend(*shown):
+    """A blank screen with (template, top-left, virtual time) pasted onto it"""
+    backend = macro_runtime.SimulatedBackend(Image.new('RGB', SCREEN_SIZE, 'white'))
+    for template, position, at in shown:
+        backend.show(template, at=at, position=position)
+    return backend
+
+def _clicks(backend):
+    return [(at, (int(args[0]), int(args[1]))) for at, name, args in backend.calls if name == 'click']
+
+# The second button is drawn away from where it was recorded, so finding it
+# and falling back to the recorded coordinates give different clicks
+FIRST = (100, 100)
+SECOND = (430, 320)
+SECOND_RECORDED = (400, 300)
+
+@pytest.mark.parametrize('gap, timing', [
+    (0.1, None),
+    (0.15, None),
+    (0.1, macro_runtime.TimingPolicy(turbo=True)),
+    (0.4, macro_runtime.TimingPolicy(speed=4)),
+])
+def test_target_appearing_after_a_click_is_searched_on_a_fresh_screen(screens, gap, timing):
+    directory, templates = screens
+    first_click = (timing or macro_runtime.AS_RECORDED).delay(1.0)
+    backend = _backend((templates[1], FIRST, 0.0), (templates[2], SECOND, first_click + 0.02))
+    actions = [
+        ['click', 1.0, *_center(FIRST), 'left', 1],
+        ['click', gap, *SECOND_RECORDED, 'left', 2],
+    ]
+    macro_runtime.run_actions(actions, SCREEN_SIZE, directory, timing, backend=backend)
+    assert [position for _, position in _clicks(backend)] == [_center(FIRST), _center(SECOND)]
+
+class _GrabBeforeSleep(macro_runtime.SimulatedBackend):
+    """Lets a sleep start only once the screen was grabbed, so a prefetch sees the screen before the gap"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.grabbed = threading.Event()
+
+    def screenshot(self):
+        frame = super().screenshot()
+        self.grabbed.set()
+        return frame
+
+    def _record(self, *args, **kwargs):
+        self.grabbed.clear()
+        super()._record(*args, **kwargs)
+
+    def sleep(self, seconds):
+        self.grabbed.wait(5)
+        super().sleep(seconds)
+
+def test_prefetched_match_is_revalidated_on_a_fresh_screen(screens):
+    directory, templates = screens
+    moved_from = (300, 250)
+    backend = _GrabBeforeSleep(Image.new('RGB', SCREEN_SIZE, 'white'))
+    for template, position, at in (
+        (templates[1], FIRST, 0.0),
+        (templates[2], moved_from, 0.0),
+        # During the gap before the second click its button moves
+        (Image.new('RGB', (TEMPLATE_SIZE, TEMPLATE_SIZE), 'white'), moved_from, 1.05),
+        (templates[2], SECOND, 1.05),
+    ):
+        backend.show(template, at=at, position=position)
+    actions = [
+        ['click', 1.0, *_center(FIRST), 'left', 1],
+        ['click', 0.1, *SECOND_RECORDED, 'left', 2],
+    ]
+    macro_runtime.Playback(SCREEN_SIZE, directory, prefetch=True, backend=backend).run(actions)
+    assert [position for _, position in _clicks(backend)] == [_center(FIRST), _center(SECOND)]
+
+WAIT_FOR_TARGET = macro_runtime.TimingPolicy(wait_for_target=True)
+
+def test_wait_for_target_clicks_as_soon_as_the_target_appears(screens):
+    directory, templates = screens
+    appears = 0.3
+    backend = _backend((templates[1], FIRST, 0.0), (templates[2], SECOND, appears))
+    actions = [
+        ['click', 1.0, *_center(FIRST), 'left', 1],
+        ['click', 0.1, *SECOND_RECORDED, 'left', 2],
+    ]
+    macro_runtime.run_actions(actions, SCREEN_SIZE, directory, WAIT_FOR_TARGET, backend=backend)
+    (first_at, first), (second_at, second) = _clicks(backend)
+    # Neither recorded gap is slept; the second click waits only for its button
+    assert (first_at, first) == (0.0, _center(FIRST))
+    assert second == _center(SECOND)
+    assert appears <= second_at < appears + WAIT_FOR_TARGET.max_poll
+
+def test_wait_for_target_falls_back_to_the_recorded_position_at_the_deadline(screens):
+    directory, templates = screens
+    backend = _backend((templates[1], FIRST, 0.0))
+    actions = [
+        ['click', 1.0, *_center(FIRST), 'left', 1],
+        ['click', 0.1, *SECOND_RECORDED, 'left', 2],
+    ]
+    macro_runtime.run_actions(actions, SCREEN_SIZE, directory, WAIT_FOR_TARGET, backend=backend)
+    _, (second_at, second) = _clicks(backend)
+    assert second == SECOND_RECORDED
+    assert second_at == pytest.approx(WAIT_FOR_TARGET.timeout(0.1))
+
+def test_observer_stops_playback_before_the_next_action(screens):
+    directory, templates = screens
+    backend = _backend((templates[1], FIRST, 0.0))
+    actions = [
+        ['click', 0.5, *_center(FIRST), 'left', 1],
+        ['write', 0.5, 'first', 0.01],
+        ['write', 0.5, 'second', 0.01],
+    ]
+    seen = []
+
+    def observe(index, total, op):
+        seen.append((index, total, op))
+        if index == 2:
+            raise macro_runtime.PlaybackStopped
+
+    macro_runtime.set_observer(observe)
+    try:
+        with pytest.raises(macro_runtime.PlaybackStopped):
+            macro_runtime.run_actions(actions, SCREEN_SIZE, directory, backend=backend)
+    finally:
+        macro_runtime.set_observer(None)
+    assert seen == [(0, 3, 'click'), (1, 3, 'write'), (2, 3, 'write')]
+    assert [name for _, name, _ in backend.calls] == ['click', 'write']
+
+def test_simulated_backend_records_input_on_a_virtual_clock(screens):
+    directory, templates = screens
+    backend = _backend((templates[1], FIRST, 0.0))
+    actions = [
+        ['move', 0.0, 50, 60],
+        ['click', 30.0, *_center(FIRST), 'left', 1],
+        ['write', 2.0, 'abc', 0.1],
+        ['hotkey', 0.0, ['ctrl', 's']],
+    ]
+    started = time.monotonic()
+    macro_runtime.run_actions(actions, SCREEN_SIZE, directory, backend=backend)
+    # Half a minute of recorded waits passes on the virtual clock only
+    assert time.monotonic() - started < 5
+    assert backend.now == pytest.approx(30.0 + 2.0 + 0.3)
+    assert backend.calls == [
+        (0.0, 'move_to', (50, 60)),
+        (30.0, 'click', (*_center(FIRST), 'left', 1)),
+        (pytest.approx(32.0), 'write', ('abc',)),
+        (pytest.approx(32.3), 'hotkey', ('ctrl', 's')),
+    ]
+    assert 'pyautogui' not in sys.modules
+
+def test_set_backend_replaces_the_default_backend(screens):
+    directory, templates = screens
+    backend = _backend((templates[1], FIRST, 0.0))
+    previous = macro_runtime.set_backend(backend)
+    try:
+        assert macro_runtime.get_backend() is backend
+        macro_runtime.run_actions([['click', 0.0, *_center(FIRST), 'left', 1]], SCREEN_SIZE, directory)
+    finally:
+        assert macro_runtime.set_backend(previous) is backend
+    assert _clicks(backend) == [(0.0, _center(FIRST))]
+
+def test_held_key_replays_its_recorded_repeats(screens):
+    directory, _ = screens
+    backend = _backend()
+    macro_runtime.run_actions([['hold', 0.0, 'backspace', 1.2, 11]], SCREEN_SIZE, directory, backend=backend)
+    assert [name for _, name, _ in backend.calls] == ['key_down'] * 12 + ['key_up']
+    assert backend.calls[-1][0] == pytest.approx(1.2)